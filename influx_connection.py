@@ -16,13 +16,18 @@ from strict_rfc3339 import rfc3339_to_timestamp
 
 class SkynetInflux:
 
-    def __init__(self):
+    def __init__(self, gzip=False):
 
         # TODO: make this configurable.
         # connect to the influx server
-        self.client = InfluxDBClient('localhost', 8086, 'root', 'root', 'skynet')
+        self.gzip = gzip
+        self.client = self.new_client()
         self.client.create_database('skynet', if_not_exists=True)
 
+    def new_client(self):
+        # a client of its own has its own connection, for use from one thread
+        return InfluxDBClient('localhost', 8086, 'root', 'root', 'skynet', gzip=self.gzip)
+
     def get_results_for_plot(self, query):
         pts = self.client.query(query)        
         results = list(pts.get_points())
@@ -11,6 +11,7 @@ import threading
 import random
 import requests
 import requests.exceptions
+import zlib
 from sys import version_info
 
 from influxdb.line_protocol import make_lines
@@ -59,6 +60,11 @@ class InfluxDBClient(object):
     :type udp_port: int
     :param proxies: HTTP(S) proxy to use for Requests, defaults to {}
     :type proxies: dict
+    :param gzip: gzip the bodies of writes and ask for gzipped responses,
+        defaults to False. requests already sends Accept-Encoding: gzip and
+        decompresses responses by default, so for queries this only makes
+        that explicit; the saving is on writes.
+    :type gzip: bool
     """
 
     def __init__(self,
@@ -73,6 +79,7 @@ class InfluxDBClient(object):
                  use_udp=False,
                  udp_port=4444,
                  proxies=None,
+                 gzip=False,
                  ):
         """Construct a new InfluxDBClient object."""
         self.__host = host
@@ -81,6 +88,7 @@ class InfluxDBClient(object):
         self._password = password
         self._database = database
         self._timeout = timeout
+        self._gzip = gzip
 
         self._verify_ssl = verify_ssl
 
@@ -219,6 +227,11 @@ localhost:8086/databasename', timeout=5, udp_port=159)
         if headers is None:
             headers = self._headers
 
+        if self._gzip:
+            # requests decompresses the response as it is read
+            headers = dict(headers)
+            headers['Accept-Encoding'] = 'gzip'
+
         if params is None:
             params = {}
 
@@ -254,16 +267,23 @@ localhost:8086/databasename', timeout=5, udp_port=159)
         else:
             raise InfluxDBClientError(response.content, response.status_code)
 
-    def write(self, data, params=None, expected_response_code=204):
+    def write(self, data, params=None, expected_response_code=204,
+              protocol='json'):
         """Write data to InfluxDB.
 
         :param data: the data to be written
-        :type data: dict
+        :type data: (if protocol is 'json') dict
+                    (if protocol is 'line') sequence of line protocol strings,
+                                            an already encoded body, or a
+                                            sequence of encoded bodies
+                                            (bytes ending in a newline)
         :param params: additional parameters for the request, defaults to None
         :type params: dict
         :param expected_response_code: the expected response code of the write
             operation, defaults to 204
         :type expected_response_code: int
+        :param protocol: Protocol for writing data. Either 'line' or 'json'.
+        :type protocol: str
         :returns: True, if the write operation is successful
         :rtype: bool
         """
@@ -276,11 +296,32 @@ localhost:8086/databasename', timeout=5, udp_port=159)
         else:
             precision = None
 
+        if protocol == 'json':
+            data = make_lines(data, precision).encode('utf-8')
+        elif isinstance(data, str):
+            data = data.encode('utf-8')
+        elif isinstance(data, (bytes, bytearray, memoryview)):
+            pass
+        else:
+            data = (line if isinstance(line, (bytes, bytearray, memoryview))
+                    else line.encode('utf-8') + b'\n' for line in data)
+            if not self._gzip:
+                data = b''.join(data)
+
+        if self._gzip:
+            # compressed a piece at a time, so a sequence of lines or
+            # bodies is never joined uncompressed first
+            headers = dict(headers)
+            headers['Content-Encoding'] = 'gzip'
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                data = (data,)
+            data = _gzip_body(data)
+
         self.request(
             url="write",
             method='POST',
             params=params,
-            data=make_lines(data, precision).encode('utf-8'),
+            data=data,
             expected_response_code=expected_response_code,
             headers=headers
         )
@@ -771,6 +812,9 @@ class InfluxDBClusterClient(object):
     :param healing_delay: the delay in seconds, counting from last failure of
         a server, before re-adding server to the list of working servers.
         Defaults to 15 minutes (900 seconds)
+    :param gzip: gzip the bodies of writes and ask for gzipped responses,
+        defaults to False
+    :type gzip: bool
     """
 
     def __init__(self,
@@ -786,6 +830,7 @@ class InfluxDBClusterClient(object):
                  shuffle=True,
                  client_base_class=InfluxDBClient,
                  healing_delay=900,
+                 gzip=False,
                  ):
         self.clients = [self]  # Keep it backwards compatible
         self.hosts = hosts
@@ -805,7 +850,8 @@ class InfluxDBClusterClient(object):
                                          verify_ssl=verify_ssl,
                                          timeout=timeout,
                                          use_udp=use_udp,
-                                         udp_port=udp_port)
+                                         udp_port=udp_port,
+                                         gzip=gzip)
         for method in dir(client_base_class):
             orig_attr = getattr(client_base_class, method, '')
             if method.startswith('_') or not callable(orig_attr):
@@ -948,6 +994,21 @@ def parse_dsn(dsn):
     return init_args
 
 
+def _gzip_body(chunks, level=1):
+    """Compress a request body given as a sequence of byte strings into
+    one gzip member, one chunk at a time, so the uncompressed body is never
+    put together in memory. The compressed body is built in place and sent
+    as is. Line protocol is mostly repeated measurement and tag strings,
+    which the fastest level already catches most of.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    body = bytearray()
+    for chunk in chunks:
+        body += compressor.compress(chunk)
+    body += compressor.flush()
+    return body
+
+
 def _parse_netloc(netloc):
     info = urlparse("http://{0}".format(netloc))
     return {'username': info.username or None,
@@ -24,25 +24,27 @@ class SkyNetLogger(Thread):
         self.q = Queue()
         self.s = serial_connection
 
-        def listener(timestamp, address, rtr, data_length, data_bytes):
-            o = {
-                "timestamp": timestamp,
-                "address": address,
-                "rtr": rtr,
-                "length": data_length,
-                "data": data_bytes
-            }
-
-            self.q.put(o)
+        def listener(batch):
+            self.q.put(batch)
         self.listener = listener
-        self.s.listeners.append(self.listener)
+        self.s.add_batch_listener(self.listener)
 
     def run(self):
         with open("%s_%i.log" % (self.s.name, time.time()), 'w') as f:
             try:
                 while True:
-                    r = self.q.get()
-                    f.write(json.dumps(r) + "\n")
+                    batch = self.q.get()
+                    lines = []
+                    for frame in batch:
+                        o = {
+                            "timestamp": frame.timestamp,
+                            "address": frame.address,
+                            "rtr": frame.rtr,
+                            "length": frame.length,
+                            "data": frame.data.tolist()
+                        }
+                        lines.append(json.dumps(o) + "\n")
+                    f.writelines(lines)
 
             except Exception:
-                self.s.listeners.remove(self.listener)
+                self.s.remove_listener(self.listener)
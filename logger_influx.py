@@ -10,69 +10,369 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU General Public License for more details.
 
+import bisect
 import json
 import time
-from threading import Thread
-from queue import Queue
-from skynet_parse import SkynetDecode
+from collections import deque
+from functools import partial
+from threading import Thread, Event
+from skynet_parse import numpy
+from skynet_registry import get_registry
+from skynet_deadband import SkyNetDeadband
+from skynet_line import SkyNetLineEncoder
 from influxdb import InfluxDBClient
+from influxdb.exceptions import InfluxDBClientError
 
 
+class SkyNetHistogram:
+    # counts of values at or below each bound, plus one bucket above the last
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def stats(self):
+        return {
+            "buckets": [[b, c] for b, c in zip(self.bounds + ["inf"], self.counts)],
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0,
+            "max": self.max
+        }
+
 
 class SkyNetDBLogger(Thread):
+    # Frames are encoded to line protocol in the listener thread and queued
+    # with their size and arrival time. The writer thread sends one request
+    # as soon as MAX_POINTS points or MAX_BYTES bytes are waiting, or the
+    # oldest waiting point is MAX_AGE seconds old, whichever comes first.
+    #
+    # With a SkyNetSpool, a request that can't reach influx is spooled to
+    # disk instead of dropped. Later requests go straight to the spool until
+    # the retry backoff (RETRY_MIN doubling up to RETRY_MAX seconds) is up.
+    # Spooled requests are then replayed oldest first, at no more than
+    # REPLAY_RATE bytes per second, in between the live requests.
+    #
+    # With a SkyNetWriterPool, points are split into one shard per pool
+    # worker by packet address, so every point of a series lands in the same
+    # shard. A flush hands each shard's request to the pool, which sends
+    # the shards in parallel and the requests of one shard in order. No
+    # more than MAX_IN_FLIGHT requests per shard are handed over at a time.
+
+    MAX_POINTS = 5000
+    MAX_BYTES = 1 << 20
+    MAX_AGE = 0.25
 
-    def __init__(self, port, serial_connection, db):
+    RETRY_MIN = 1.0
+    RETRY_MAX = 30.0
+    REPLAY_RATE = 2 << 20
+
+    MAX_IN_FLIGHT = 2
+
+    def __init__(self, port, serial_connection, db, scaled=False, dedup=None, spool=None, pool=None,
+                 definitions_file='static/packets.json'):
         Thread.__init__(self)
+        self.daemon = True
         self.port = port
-        self.q = Queue()
         self.s = serial_connection
         self.db = db
-        
-        with open('static/packets.json') as f:
-            self.decoder = SkynetDecode(f)
+        self.running = False
+
+        # (shard, point count, encoded body, arrival time); deque appends
+        # and pops are atomic, so neither side takes a lock per item
+        self._pending = deque()
+        self._wake = Event()
+
+        # writes through the pool use its clients; the logger's own one is
+        # only for the spool replay, so it isn't shared with the web threads
+        self.pool = pool
+        self.shards = pool.workers if pool is not None else 1
+        self.client = pool.make_client() if pool is not None else db.client
+        self.in_flight = 0
+        # (point count, bodies, arrival time, error) back from the pool
+        self._done = deque()
+
+        self.spool = spool
+        self._retry = self.RETRY_MIN
+        self._retry_at = 0
+
+        self.points = 0
+        self.writes = 0
+        self.errors = 0
+        self.rejected = 0
+        self.batch_sizes = SkyNetHistogram([1, 10, 100, 1000, 2000, 5000, 10000])
+        self.flush_latency = SkyNetHistogram([0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0])
+
+        self.scaled = scaled
+        self.registry = get_registry(definitions_file)
+        self.deadband = SkyNetDeadband(scaled)
+        self.encoder = SkyNetLineEncoder(self.s.name)
+
+        # a SkyNetDedup shared with the loggers of other ports on the same bus
+        self.dedup = dedup
 
         # create a listener that can be attached to a serial port.
-        def listener(timestamp, address, rtr, data_length, data_bytes, origin="device"):
-            
-            decoded = self.decoder.decode(address, rtr, data_bytes)
-            
-            if decoded is None:
-                return
-
-            point = {
-                "measurement": decoded["name"],
-                "time": int(timestamp*1e9),
-                "tags": {
-                    "board": decoded["board"],
-                    "name": self.s.name,
-                    "rtr": str(rtr),
-                    "origin": origin
-                },
-                "fields": decoded["data"]
-            }
-
-            self.q.put(point)
-
-        self.listener = listener
-        self.s.listeners.append(self.listener)
+        def listener(batch, origin="device"):
 
-    def run(self):
+            if self.dedup is not None:
+                batch = self.dedup.filter_batch(self.port, batch)
+
+            decoder = self.get_decoder()
+            keep = self.deadband.keep
+            encode = self.encoder.encode
+            shards = self.shards
+            outs = [bytearray() for i in range(shards)]
+            counts = [0] * shards
+
+            if numpy is not None:
+                for address, p in decoder.decode_batch(batch).items():
+                    columns = [c.tolist() for c in p["data"].values()]
+                    shard = address % shards
+                    out = outs[shard]
+                    count = 0
+
+                    for timestamp, rtr, values in zip(p["timestamp"].tolist(), p["rtr"].tolist(), zip(*columns)):
+                        if keep(address, timestamp, values) and encode(out, address, rtr, origin, timestamp, values):
+                            count += 1
+
+                    counts[shard] += count
+            else:
+                for frame in batch:
+                    decoded = decoder.decode_frame(frame)
+
+                    if decoded is None:
+                        continue
+
+                    values = decoded.values
+
+                    shard = frame.address % shards
+
+                    if keep(frame.address, frame.timestamp, values) and \
+                            encode(outs[shard], frame.address, frame.rtr, origin, frame.timestamp, values):
+                        counts[shard] += 1
+
+            self.enqueue(outs, counts)
+
+        # Multi-process ingest hands over records that are already decoded,
+        # with every field value widened to a double in shared memory.
+        def decoded_listener(records, origin="device"):
+
+            decoder = self.get_decoder()
+            shards = self.shards
+            outs = [bytearray() for i in range(shards)]
+            counts = [0] * shards
+
+            for r in records:
+                if self.dedup is not None and not self.dedup.first(self.port, r[0], r[1], r[2], r[5][:r[3]]):
+                    continue
+
+                d = decoder.packets_by_address.get(r[1])
+
+                # short frames (e.g. RTRs) come without values
+                if d is None or r[4] != len(d["data"]):
+                    continue
+
+                values = [v if field["type"] == "float" else int(v)
+                          for field, v in zip(d["data"], r[6:6 + r[4]])]
+                values = decoder.field_values(r[1], values)
+
+                shard = r[1] % shards
+
+                if self.deadband.keep(r[1], r[0], values) and \
+                        self.encoder.encode(outs[shard], r[1], not not r[2], origin, r[0], values):
+                    counts[shard] += 1
+
+            self.enqueue(outs, counts)
+
+        if hasattr(self.s, 'add_decoded_listener'):
+            self.listener = decoded_listener
+            self.s.add_decoded_listener(self.listener)
+        else:
+            self.listener = listener
+            self.s.add_batch_listener(self.listener)
+
+    def get_decoder(self):
+        # version first: if a reload lands in between, the deadband rules
+        # just get rebuilt again on the next batch
+        version = self.registry.version
+        decoder = self.registry.get(self.scaled)
+        self.deadband.update(decoder, version)
+        self.encoder.update(decoder, version)
+        return decoder
+
+    def enqueue(self, outs, counts):
+        # one encoded body and point count per shard
+        t = time.monotonic()
+
+        for shard, count in enumerate(counts):
+            if count:
+                self._pending.append((shard, count, bytes(outs[shard]), t))
+                self._wake.set()
+
+    def stats(self):
+        return {
+            "queued": len(self._pending),
+            "points": self.points,
+            "writes": self.writes,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "in_flight": self.in_flight,
+            "down": time.monotonic() < self._retry_at,
+            "spool": self.spool.stats() if self.spool is not None else {},
+            "batch_size": self.batch_sizes.stats(),
+            "flush_latency": self.flush_latency.stats()
+        }
+
+    def start(self):
+        self.running = True
+        super(SkyNetDBLogger, self).start()
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+        self.join()
+        self.s.remove_listener(self.listener)
+
+    def write(self, body):
+        # body: bytes, or a list of bodies; None once influx has it,
+        # otherwise the exception
         try:
-            while True:
-                points = []
-                time.sleep(1)  # wait for more points (only make influx call 1/sec)
-                
-                points.append(self.q.get())
-                
-                while not self.q.empty():
-                    points.append(self.q.get())
-                
-                try:
-                    self.db.client.write_points(points)
-                except Exception as e:
-                    print(e)
-                
-                print(len(points))
-
-        except Exception:
-            self.s.listeners.remove(self.listener)
+            self.client.write(body, params={'db': self.client._database}, protocol='line')
+        except Exception as e:
+            return e
+
+        return None
+
+    def written(self, count, oldest, error):
+        # False if influx couldn't be reached and the body should be kept
+        if error is None:
+            self._retry = self.RETRY_MIN
+            self.points += count
+            self.writes += 1
+            if oldest is not None:
+                self.batch_sizes.add(count)
+                self.flush_latency.add(time.monotonic() - oldest)
+            return True
+
+        self.errors += 1
+        print(error)
+
+        if isinstance(error, InfluxDBClientError):
+            # influx rejected the points themselves; sending them again
+            # won't help
+            self.rejected += 1
+            return True
+
+        self._retry_at = time.monotonic() + self._retry
+        self._retry = min(self._retry * 2, self.RETRY_MAX)
+        return False
+
+    def completed(self, count, bodies, oldest, error):
+        # called from a pool worker
+        self._done.append((count, bodies, oldest, error))
+        self._wake.set()
+
+    def flush(self, shards, oldest):
+        # shards: {shard: [point count, [bodies]]}
+        # the client joins the bodies, or compresses them one at a time, so
+        # they are only joined here when they go to the spool
+        for shard, (count, bodies) in shards.items():
+            if self.spool is not None and time.monotonic() < self._retry_at:
+                # influx was just down; don't wait on it timing out again
+                self.spool.append(count, b''.join(bodies))
+            elif self.pool is not None:
+                self.in_flight += 1
+                self.pool.submit((self.port, shard), bodies, partial(self.completed, count, bodies, oldest))
+            elif not self.written(count, oldest, self.write(bodies)) and self.spool is not None:
+                self.spool.append(count, b''.join(bodies))
+
+    def replay(self):
+        # sends the oldest spooled request; returns when to try the next one
+        now = time.monotonic()
+
+        if now < self._retry_at:
+            return self._retry_at
+
+        record = self.spool.peek()
+
+        if record is None:
+            return now + 1.0
+
+        count, body = record
+        error = self.write(body)
+
+        if not self.written(count, None, error):
+            return self._retry_at
+
+        if error is None:
+            self.spool.commit()
+        else:
+            self.spool.skip()
+
+        return time.monotonic() + len(body) / self.REPLAY_RATE
+
+    def run(self):
+        pending = self._pending
+        done = self._done
+        shards = {}
+        count = 0
+        size = 0
+        oldest = None
+        replay_at = float('inf') if self.spool is None else 0
+        max_in_flight = self.MAX_IN_FLIGHT * self.shards
+
+        while self.running or pending or shards or self.in_flight:
+            self._wake.clear()
+
+            while done:
+                n, bodies, t, error = done.popleft()
+                self.in_flight -= 1
+                if not self.written(n, t, error) and self.spool is not None:
+                    self.spool.append(n, b''.join(bodies))
+
+            while pending and count < self.MAX_POINTS and size < self.MAX_BYTES:
+                shard, n, body, t = pending.popleft()
+                if oldest is None:
+                    oldest = t
+                parts = shards.get(shard)
+                if parts is None:
+                    parts = shards[shard] = [0, []]
+                parts[0] += n
+                parts[1].append(body)
+                count += n
+                size += len(body)
+
+            if not self.running:
+                # anything still spooled at stop is replayed on the next start
+                replay_at = float('inf')
+            elif time.monotonic() >= replay_at:
+                replay_at = self.replay()
+
+            now = time.monotonic()
+
+            if not shards:
+                self._wake.wait(min(1.0, replay_at - now))
+                continue
+
+            age = now - oldest
+
+            if self.in_flight >= max_in_flight:
+                # the pool wakes us when a write is over
+                self._wake.wait(min(1.0, replay_at - now))
+            elif count >= self.MAX_POINTS or size >= self.MAX_BYTES or age >= self.MAX_AGE or not self.running:
+                self.flush(shards, oldest)
+                shards = {}
+                count = 0
+                size = 0
+                oldest = None
+            else:
+                self._wake.wait(min(self.MAX_AGE - age, replay_at - now))
@@ -18,14 +18,63 @@ import json
 from queue import Queue
 
 from skynet_serial import SkyNetSerial, get_serial_ports
+from skynet_aio import SkyNetAsyncSerial, SkyNetSerialLoop
+from skynet_ingest import SkyNetIngest
 from logger_influx import SkyNetDBLogger
 from server_sent_events import ServerSentEvent
 from influx_connection import SkynetInflux
+from skynet_registry import get_registry
+from skynet_chunk import SkyNetChunkAssembler, SkyNetChunkFileSink
+from skynet_dedup import SkyNetDedup
+from skynet_spool import SkyNetSpool
+from skynet_writer import SkyNetWriterPool
 import strict_rfc3339
+import os
+
+# read every port from one shared event loop instead of a thread per port
+ASYNC_SERIAL = False
+
+# read and decode each port in its own worker process
+INGEST_PROCESSES = False
+
+# store field values with their scale and decimals applied, instead of raw
+SCALED_STORAGE = False
+
+# Note: with numpy installed, the influx loggers decode whole batches with
+# decode_batch, so the generated skynet_packets.py decoders are not used on
+# that path (with either ASYNC_SERIAL or SCALED_STORAGE) and won't speed it
+# up; they serve decode() and decode_frame() callers.
+
+# log a frame only once when several gateways on the same bus all see it
+DEDUP_GATEWAYS = False
+
+# reassemble chunk transfers (static/chunks.json) into files under this directory
+CHUNK_DIR = None
+
+# keep writes influx couldn't take on disk under this directory (one spool
+# per port) and replay them when it is back; None drops them
+SPOOL_DIR = 'spool'
+
+# gzip writes to influx, for a server on the other end of a slow link
+INFLUX_GZIP = False
+
+# send influx writes from this many threads, each with its own connection;
+# None writes from each port's logger thread
+WRITER_THREADS = None
 
 app = Flask(__name__)
 serial_connections = {}
-db = SkynetInflux()
+loggers = {}
+chunk_assemblers = {}
+
+# Ingest workers are spawned, so each one runs this file again as
+# __mp_main__. They only need skynet_ingest: no influx connection or
+# writer threads there.
+if __name__ != '__mp_main__':
+    dedup = SkyNetDedup() if DEDUP_GATEWAYS else None
+    serial_loop = SkyNetSerialLoop()
+    db = SkynetInflux(gzip=INFLUX_GZIP)
+    writer_pool = SkyNetWriterPool(db.new_client, WRITER_THREADS) if WRITER_THREADS else None
 
 aggregators = ['count', 'distinct', 'integral', 'mean', 'median', 'spread', 'sum', 'bottom',
                 'first', 'last', 'max', 'min', 'percentile', 'top', 'derivative',
@@ -49,6 +98,12 @@ def serial_view(port):
         abort(404)
     return render_template('default.html', s=serial_connections[port], port=port)
 
+@app.route('/packets.js')
+def packets_js():
+    # served from the shared registry, so browsers pick up regenerated
+    # definitions without a restart
+    return Response(get_registry().packets_js(), mimetype="application/javascript")
+
 @app.route('/db/query')
 def db_query():
 
@@ -106,12 +161,26 @@ def serial_connect():
 
     port = "/dev/serial/by-id/%s" % _id
 
-    s = SkyNetSerial(serial_port=port, baud=baud, name=name)
-    s.start()
+    if INGEST_PROCESSES:
+        s = SkyNetIngest(serial_port=port, baud=baud, name=name)
+        s.start()
+    elif ASYNC_SERIAL:
+        s = serial_loop.add(SkyNetAsyncSerial(serial_port=port, baud=baud, name=name))
+    else:
+        s = SkyNetSerial(serial_port=port, baud=baud, name=name)
+        s.start()
     serial_connections[_id] = s
 
-    logger = SkyNetDBLogger(_id, serial_connections[_id], db)
+    spool = SkyNetSpool(os.path.join(SPOOL_DIR, _id)) if SPOOL_DIR is not None else None
+    logger = SkyNetDBLogger(_id, serial_connections[_id], db, scaled=SCALED_STORAGE, dedup=dedup, spool=spool,
+                            pool=writer_pool)
     logger.start()
+    loggers[_id] = logger
+
+    if CHUNK_DIR is not None and os.path.exists('static/chunks.json'):
+        chunks = SkyNetChunkAssembler.from_file('static/chunks.json', SkyNetChunkFileSink(CHUNK_DIR, name))
+        s.add_batch_listener(chunks.listener)
+        chunk_assemblers[_id] = chunks
 
     return ""
 
@@ -131,37 +200,66 @@ def serial_send(port):
     return ""
 
 
+@app.route('/serial/stats/<port>')
+def serial_stats(port):
+
+    if port not in serial_connections:
+        abort(404)
+
+    s = serial_connections[port]
+    stats = {
+        "rejected_frames": s.rejected_frames,
+        "resync_events": s.resync_events,
+        "byte_errors": s.byte_errors,
+        "definitions_version": get_registry().version,
+        "error": s.error,
+        "reconnects": getattr(s, "reconnects", 0),
+        "gaps": list(getattr(s, "gaps", [])),
+        "send": s.send_stats() if hasattr(s, "send_stats") else {},
+        "listeners": s.dispatch.stats(),
+        "logger": loggers[port].stats() if port in loggers else {},
+        "writers": writer_pool.stats() if writer_pool is not None else {},
+        "deadband": loggers[port].deadband.stats() if port in loggers else {},
+        "dedup": dedup.stats() if dedup is not None else {},
+        "chunks": chunk_assemblers[port].stats() if port in chunk_assemblers else {}
+    }
+
+    return json.dumps(stats)
+
+
 @app.route('/serial/stream/<port>')
 def serial_stream(port):
 
     q = Queue()
     s = serial_connections[port]
 
-    def listener(timestamp, address, rtr, data_length, data_bytes):
-
-        o = {
-            "timestamp": timestamp,
-            "address": address,
-            "rtr": rtr,
-            "length": data_length,
-            "data": data_bytes
-        }
-
-        q.put(o)
+    def listener(batch):
+        q.put(batch)
 
     def gen():
-        s.listeners.append(listener)
+        s.add_batch_listener(listener)
 
         try:
             while True:
-                r = q.get()
-                ev = ServerSentEvent(json.dumps(r))
-                yield ev.encode()
+                batch = q.get()
+                events = []
+                for frame in batch:
+                    o = {
+                        "timestamp": frame.timestamp,
+                        "address": frame.address,
+                        "rtr": frame.rtr,
+                        "length": frame.length,
+                        "data": frame.data.tolist()
+                    }
+                    events.append(ServerSentEvent(json.dumps(o)).encode())
+                yield "".join(events)
         except GeneratorExit:
-            s.listeners.remove(listener)
+            s.remove_listener(listener)
 
     return Response(gen(), mimetype="text/event-stream")
 
 
 if __name__ == '__main__':
+    if ASYNC_SERIAL:
+        serial_loop.start()
     app.run(debug=True, threaded=True)
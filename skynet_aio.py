@@ -0,0 +1,228 @@
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import asyncio
+import os
+import time
+from collections import deque
+from threading import Thread, Lock
+
+from skynet_dispatch import SkyNetDispatch
+from skynet_frame import SkyNetClock, encode_frame_cached
+from skynet_port import SkyNetPort, serial_decoder
+
+
+class SkyNetAsyncSerial(SkyNetPort):
+    # Non-blocking counterpart of SkyNetSerial. It has no thread of its own;
+    # a SkyNetSerialLoop reads it together with every other port. The port
+    # may also be given as an already open file descriptor (e.g. the slave
+    # side of os.openpty()), in which case no serial setup is done. A port
+    # opened by path is reopened after it drops, like SkyNetSerial does; a
+    # file descriptor can't be, so the port just stops with `error` set.
+
+    READ_SIZE = 65536
+
+    # reopen delays after the port drops, doubling up to the max
+    RECONNECT_MIN = 0.05
+    RECONNECT_MAX = 5.0
+
+    def __init__(self, serial_port='/dev/ttyUSB0', baud=500000, name=''):
+
+        self.serial_port = serial_port
+        self.baud = baud
+
+        self._port_handle = None
+        self._fd = None
+        self._loop = None
+        self._tx = bytearray()
+        self.running = False
+        self.error = False
+        self.name = name
+
+        self.dispatch = SkyNetDispatch()
+        self.decoder = serial_decoder(baud)
+        self.clock = SkyNetClock()
+
+        # (lost, restored) wall times of the most recent outages
+        self.gaps = deque(maxlen=100)
+        self.reconnects = 0
+        self._lost_at = None
+        self._backoff = self.RECONNECT_MIN
+        self._retry = None
+
+    def open(self, loop):
+        # must be called from the loop's own thread
+        self._loop = loop
+        self.running = True
+
+        try:
+            self._open()
+        except Exception:
+            if isinstance(self.serial_port, int):
+                raise
+            # not there yet; keep trying, like SkyNetSerial
+            self._lost_at = time.time()
+            self._lost()
+
+    def _open(self):
+        if isinstance(self.serial_port, int):
+            self._fd = self.serial_port
+        else:
+            import serial
+            self._port_handle = serial.Serial(self.serial_port, self.baud, timeout=0)
+            self._fd = self._port_handle.fileno()
+
+        os.set_blocking(self._fd, False)
+        # a partial frame from before a drop is useless; wait for the next
+        # start-of-frame
+        self.decoder.reset()
+        self.clock.anchor()
+        self._loop.add_reader(self._fd, self._on_readable)
+
+    def _release(self):
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            self._loop.remove_writer(self._fd)
+            self._fd = None
+        if self._port_handle is not None:
+            try:
+                self._port_handle.close()
+            except Exception:
+                pass
+            self._port_handle = None
+        self._tx.clear()
+
+    def _lost(self):
+        # the device went away (e.g. USB re-enumeration)
+        self.error = True
+        self._release()
+
+        if isinstance(self.serial_port, int):
+            self.running = False
+            return
+
+        if self._lost_at is None:
+            self._lost_at = time.time()
+            self._backoff = self.RECONNECT_MIN
+            self._reopen()
+        else:
+            self._retry = self._loop.call_later(self._backoff, self._reopen)
+            self._backoff = min(self._backoff * 2, self.RECONNECT_MAX)
+
+    def _reopen(self):
+        self._retry = None
+
+        try:
+            self._open()
+        except Exception:
+            self._lost()
+            return
+
+        self.gaps.append((self._lost_at, time.time()))
+        self.reconnects += 1
+        self._lost_at = None
+        self.error = False
+
+    def close(self):
+        if self._retry is not None:
+            self._retry.cancel()
+            self._retry = None
+
+        self._release()
+        self.running = False
+
+    def _on_readable(self):
+        try:
+            chunk = os.read(self._fd, self.READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            chunk = b''
+
+        if not chunk:
+            self._lost()
+            return
+
+        self.dispatch.publish(self.decoder.feed(chunk, self.clock.now()))
+
+    def send(self, address, rtr, data):
+
+        if not self.running:
+            return False
+
+        if len(data) > 15:
+            return False
+
+        self._loop.call_soon_threadsafe(self._write, encode_frame_cached(address, not not rtr, tuple(data)))
+        return True
+
+    def _write(self, data):
+        if self._fd is None:
+            return
+
+        self._tx += data
+        try:
+            n = os.write(self._fd, self._tx)
+        except BlockingIOError:
+            n = 0
+        del self._tx[:n]
+
+        if self._tx:
+            self._loop.add_writer(self._fd, self._write, b'')
+        else:
+            self._loop.remove_writer(self._fd)
+
+
+class SkyNetSerialLoop(Thread):
+    # One event loop thread that reads any number of SkyNetAsyncSerial ports.
+    # The thread starts with the first port added, if nothing started it
+    # before, so it works under any WSGI host; start() may be called again.
+
+    def __init__(self):
+        super(SkyNetSerialLoop, self).__init__()
+        self.daemon = True
+
+        self.loop = asyncio.new_event_loop()
+        self.ports = []
+        self._start_lock = Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self.ident is None:
+                super(SkyNetSerialLoop, self).start()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _call(self, fn, *args):
+        # run fn on the loop thread and wait for it, re-raising any error
+        async def call():
+            return fn(*args)
+        return asyncio.run_coroutine_threadsafe(call(), self.loop).result()
+
+    def add(self, port):
+        self.start()
+        self._call(port.open, self.loop)
+        self.ports.append(port)
+        return port
+
+    def remove(self, port):
+        self._call(port.close)
+        self.ports.remove(port)
+
+    def stop(self):
+        for p in list(self.ports):
+            self.remove(p)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.ident is not None:
+            self.join()
@@ -0,0 +1,946 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import argparse
+import io
+import os
+import random
+import time
+import tty
+from threading import Thread, Event
+
+from skynet_frame import encode_frame, read_capture
+from skynet_serial import SkyNetSerial
+from tests.stubs import StubConnection, StubInflux, bench_definitions, packet_frames
+
+
+def random_frames(count, seed=0):
+    r = random.Random(seed)
+    frames = []
+    for i in range(count):
+        data = [r.randrange(256) for _ in range(r.randrange(9))]
+        frames.append((r.randrange(2048), r.random() < 0.1, data))
+    return frames
+
+
+class LegacySkyNetSerial(SkyNetSerial):
+    # the original byte-at-a-time receive loop, kept as the "before" baseline
+
+    def run(self):
+        import serial
+        self._port_handle = serial.Serial(self.serial_port, self.baud)
+
+        self.running = True
+        escaped = False
+        data_bytes = []
+        meta_bytes = []
+        crc_bytes = []
+        data_length = 0
+        address = 0
+        rtr = False
+        timestamp = 0
+
+        c = self._port_handle.read()
+        while c != self.START_CHARACTER:
+            c = self._port_handle.read()
+
+        while self.running:
+            try:
+                c = self._port_handle.read()
+
+                if c == self.START_CHARACTER:
+                    timestamp = time.time()
+                    data_bytes = []
+                    meta_bytes = []
+                    crc_bytes = []
+                    continue
+
+                if c == self.ESCAPE_CHARACTER:
+                    escaped = True
+                    continue
+
+                c = ord(c)
+
+                if escaped:
+                    c ^= 0x20
+                    escaped = False
+
+                if len(meta_bytes) == 0:
+                    meta_bytes.append(c)
+                elif len(meta_bytes) == 1:
+                    meta_bytes.append(c)
+                    address = (meta_bytes[1] // 32 + meta_bytes[0] * 8)
+                    rtr = not not(meta_bytes[1] & 16)
+                    data_length = meta_bytes[1] & 15
+                elif len(data_bytes) < data_length:
+                    data_bytes.append(c)
+                elif len(crc_bytes) == 0:
+                    crc_bytes.append(c)
+                    for l in list(self.dispatch.subscribers):
+                        l(timestamp, address, rtr, data_length, data_bytes)
+            except Exception:
+                self.error = True
+                break
+
+        self.running = False
+
+
+def legacy_send(s, address, rtr, data):
+    # SkyNetSerial.send as it was, minus the print of every frame
+    import struct
+
+    to_send = SkyNetSerial.START_CHARACTER
+    rtr = 1 if rtr else 0
+    unescaped_data = [address//8, (address % 8)*32+rtr*16+len(data)] + data
+    unescaped_data.append(sum(unescaped_data) % 256)
+
+    for d in unescaped_data:
+        if d == SkyNetSerial.ESCAPE_VALUE or d == SkyNetSerial.START_VALUE:
+            to_send += SkyNetSerial.ESCAPE_CHARACTER
+            d ^= 0x20
+        to_send += struct.pack('>B', d)
+
+    s._port_handle.write(to_send)
+
+
+def legacy_decode(packets_by_address, address, rtr, data_bytes):
+    # SkynetDecode.decode as it was: one format string and unpack per field
+    import struct
+
+    if address not in packets_by_address:
+        return None
+
+    d = packets_by_address[address]
+    packet = {"name": d["name"], "board": d["board"], "data": {}}
+    byte = 0
+    endian = "<" if d["endian"] == "little" else ">"
+
+    for field in d["data"]:
+        if field["type"] == "uint8_t":
+            format, length = "B", 1
+        elif field["type"] == "int8_t":
+            format, length = "b", 1
+        elif field["type"] == "uint16_t":
+            format, length = endian + "H", 2
+        elif field["type"] == "int16_t":
+            format, length = endian + "h", 2
+        elif field["type"] == "uint32_t":
+            format, length = endian + "I", 4
+        elif field["type"] == "int32_t":
+            format, length = endian + "i", 4
+        elif field["type"] == "float":
+            format, length = endian + "f", 4
+
+        packet["data"][field["name"]] = struct.unpack(format, bytearray(data_bytes[byte:byte+length]))[0]
+        byte += length
+
+    return packet
+
+
+def run_pty(serial_class, stream, expected):
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    s = serial_class(serial_port=os.ttyname(slave))
+
+    received = []
+    done = Event()
+
+    def listener(timestamp, address, rtr, data_length, data_bytes):
+        received.append((address, rtr, list(data_bytes)))
+        if len(received) >= expected:
+            done.set()
+
+    s.add_listener(listener)
+    s.start()
+    # opening the port flushes its input, so wait until it is open
+    while not s.running or s._port_handle is None:
+        time.sleep(0.01)
+
+    def writer():
+        view = memoryview(stream)
+        while view:
+            n = os.write(master, view[:4096])
+            view = view[n:]
+
+    start = time.time()
+    w = Thread(target=writer, daemon=True)
+    w.start()
+    done.wait(120)
+    elapsed = time.time() - start
+
+    # unblock the reader so the thread can exit
+    s.running = False
+    os.write(master, SkyNetSerial.START_CHARACTER)
+    s.join(5)
+    os.close(master)
+    os.close(slave)
+
+    return received, elapsed
+
+
+def bench_serial(args):
+    frames = random_frames(args.frames)
+    stream = b''.join(encode_frame(*f) for f in frames)
+    expected = [(a, r, d) for a, r, d in frames]
+
+    results = {}
+    for label, cls in (("before", LegacySkyNetSerial), ("after", SkyNetSerial)):
+        received, elapsed = run_pty(cls, stream, len(frames))
+        if received != expected:
+            print("%-8s MISMATCH: %i of %i frames received" % (label, len(received), len(frames)))
+        results[label] = len(received) / elapsed
+        print("%-8s %10.0f frames/s  (%i frames in %.2f s)" % (label, results[label], len(received), elapsed))
+
+    print("speedup  %10.1fx" % (results["after"] / results["before"]))
+
+
+def bench_aio(args):
+    from skynet_aio import SkyNetAsyncSerial, SkyNetSerialLoop
+
+    frames = random_frames(args.frames)
+    stream = b''.join(encode_frame(*f) for f in frames)
+    total = args.frames * args.ports
+
+    loop = SkyNetSerialLoop()
+    loop.start()
+
+    received = [0]
+    done = Event()
+
+    def listener(batch):
+        received[0] += len(batch)
+        if received[0] >= total:
+            done.set()
+
+    ptys = []
+    for i in range(args.ports):
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        port = loop.add(SkyNetAsyncSerial(serial_port=slave, name="pty%i" % i))
+        port.add_batch_listener(listener)
+        ptys.append((master, slave, port))
+
+    def writer(fd):
+        view = memoryview(stream)
+        while view:
+            n = os.write(fd, view[:4096])
+            view = view[n:]
+
+    start = time.time()
+    for master, slave, port in ptys:
+        Thread(target=writer, args=(master,), daemon=True).start()
+    done.wait(120)
+    elapsed = time.time() - start
+
+    loop.stop()
+    for master, slave, port in ptys:
+        os.close(master)
+        os.close(slave)
+
+    print("%i ports, one loop thread: %i frames in %.2f s, %.0f frames/s" %
+          (args.ports, received[0], elapsed, received[0] / elapsed))
+
+
+def bench_ingest(args):
+    import json
+    import tempfile
+    from skynet_ingest import SkyNetIngest
+
+    defs = bench_definitions()
+    stream = b''.join(encode_frame(*f) for f in packet_frames(defs, args.frames))
+
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(defs, f)
+
+    for ports in sorted(set([1, args.ports])):
+        total = args.frames * ports
+        received = [0]
+        done = Event()
+
+        def listener(records):
+            received[0] += len(records)
+            if received[0] >= total:
+                done.set()
+
+        ptys = []
+        for i in range(ports):
+            master, slave = os.openpty()
+            tty.setraw(slave)
+            s = SkyNetIngest(serial_port=os.ttyname(slave), name="pty%i" % i, definitions_file=f.name)
+            s.add_decoded_listener(listener)
+            s.start()
+            ptys.append((master, slave, s))
+
+        # give the workers time to spawn and open their ports
+        time.sleep(2)
+
+        def writer(fd):
+            view = memoryview(stream)
+            while view:
+                n = os.write(fd, view[:4096])
+                view = view[n:]
+
+        start = time.time()
+        for master, slave, s in ptys:
+            Thread(target=writer, args=(master,), daemon=True).start()
+        done.wait(120)
+        elapsed = time.time() - start
+
+        for master, slave, s in ptys:
+            s.stop()
+            os.close(master)
+            os.close(slave)
+
+        print("%2i worker processes: %i decoded frames in %.2f s, %.0f frames/s" %
+              (ports, received[0], elapsed, received[0] / elapsed))
+
+    os.remove(f.name)
+
+
+def bench_reconnect(args):
+    import tempfile
+
+    # the reader opens a symlink, like /dev/serial/by-id, that is pointed at
+    # a fresh pty after every simulated unplug
+    link = os.path.join(tempfile.mkdtemp(), "tty")
+
+    def plug():
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(os.ttyname(slave), link)
+        return master, slave
+
+    master, slave = plug()
+    s = SkyNetSerial(serial_port=link)
+
+    received = []
+
+    def listener(timestamp, address, rtr, data_length, data_bytes):
+        received.append((time.time(), data_bytes[0] * 256 + data_bytes[1]))
+
+    s.add_listener(listener)
+    s.start()
+    time.sleep(0.5)
+
+    period = 1.0 / args.rate
+    sent = 0
+    unplugs = []
+    for cycle in range(args.cycles):
+        end = time.time() + args.interval
+        while time.time() < end:
+            os.write(master, encode_frame(0x100, False, [sent // 256 % 256, sent % 256]))
+            sent += 1
+            time.sleep(period)
+
+        os.close(master)
+        os.close(slave)
+        unplugs.append((time.time(), sent))
+        master, slave = plug()
+
+    end = time.time() + args.interval
+    while time.time() < end:
+        os.write(master, encode_frame(0x100, False, [sent // 256 % 256, sent % 256]))
+        sent += 1
+        time.sleep(period)
+
+    time.sleep(0.5)
+    s.running = False
+    os.write(master, encode_frame(0x100, False, [0, 0]))
+    s.join(5)
+
+    latencies = []
+    for t, n in unplugs:
+        after = [r for r in received if r[0] > t]
+        if after:
+            latencies.append(after[0][0] - t)
+
+    print("%i unplugs, %i reconnects, %i of %i frames lost (%.2f%%)" %
+          (len(unplugs), s.reconnects, sent - len(received), sent, 100.0 * (sent - len(received)) / sent))
+    if latencies:
+        print("reconnect latency: mean %.1f ms, max %.1f ms" %
+              (1000 * sum(latencies) / len(latencies), 1000 * max(latencies)))
+    for lost, restored in s.gaps:
+        print("gap %.1f ms" % (1000 * (restored - lost)))
+
+
+def bench_send(args):
+    from skynet_frame import SkynetFrameDecoder
+
+    # a bench script cycling through a handful of command packets
+    commands = [(0x200 + i % 4, False, [i % 4, 0x7E, 100, 0, 0, 0, 0, i % 4]) for i in range(args.frames)]
+
+    for label in ("before", "after"):
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        s = SkyNetSerial(serial_port=os.ttyname(slave))
+        s.start()
+        while not s.running:
+            time.sleep(0.01)
+
+        received = bytearray()
+        expected = sum(len(encode_frame(*c)) for c in commands)
+
+        def drain():
+            while len(received) < expected:
+                received.extend(os.read(master, 65536))
+
+        d = Thread(target=drain, daemon=True)
+        d.start()
+
+        start = time.time()
+        for c in commands:
+            if label == "before":
+                legacy_send(s, *c)
+            else:
+                s.send(*c)
+        call_time = time.time() - start
+        d.join(60)
+        elapsed = time.time() - start
+
+        frames = SkynetFrameDecoder().feed(bytes(received))
+        print("%-8s %9.0f sends/s from the caller, %9.0f frames/s on the wire, %i frames ok" %
+              (label, len(commands) / call_time, len(commands) / elapsed, len(frames)))
+        if label == "after":
+            print("         %s" % s.send_stats())
+
+        s.running = False
+        s.send_queue.stop()
+        os.write(master, SkyNetSerial.START_CHARACTER)
+        s.join(5)
+        os.close(master)
+        os.close(slave)
+
+
+def bench_decode(args):
+    import json
+    from skynet_parse import SkynetDecode
+
+    defs = bench_definitions()
+    decoder = SkynetDecode(io.StringIO(json.dumps(defs)))
+    frames = packet_frames(defs, args.frames)
+
+    start = time.time()
+    before = [legacy_decode(decoder.packets_by_address, a, r, d) for a, r, d in frames]
+    legacy_time = time.time() - start
+
+    start = time.time()
+    after = [decoder.decode(a, r, d) for a, r, d in frames]
+    elapsed = time.time() - start
+
+    if repr(before) != repr(after):  # repr, since random floats include NaN
+        print("MISMATCH between old and new decode")
+    print("before   %10.0f frames/s" % (len(frames) / legacy_time))
+    print("after    %10.0f frames/s" % (len(frames) / elapsed))
+    print("speedup  %10.1fx" % (legacy_time / elapsed))
+
+    try:
+        import numpy
+    except ImportError:
+        return
+
+    from skynet_frame import SkyNetFrameBatch
+    batch = SkyNetFrameBatch.from_frames([(0.0, a, r, len(d), d) for a, r, d in frames])
+
+    start = time.time()
+    columns = decoder.decode_batch(batch)
+    elapsed = time.time() - start
+
+    print("batch    %10.0f frames/s  (%i frames into %i packet types)" %
+          (len(frames) / elapsed, sum(len(c["timestamp"]) for c in columns.values()), len(columns)))
+
+
+def bench_frames(args):
+    import json
+    import tracemalloc
+    from collections import namedtuple
+    from skynet_frame import SkynetFrameDecoder
+    from skynet_parse import SkynetDecode
+
+    defs = bench_definitions()
+    decoder = SkynetDecode(io.StringIO(json.dumps(defs)))
+    stream = b''.join(encode_frame(*f) for f in packet_frames(defs, args.frames))
+
+    # what each frame used to turn into on its way to influx
+    LegacyFrame = namedtuple('Frame', ['timestamp', 'address', 'rtr', 'length', 'data'])
+
+    def before(frames):
+        out = []
+        for f in frames:
+            frame = LegacyFrame(f.timestamp, f.address, f.rtr, f.length, list(f.data))
+            decoded = decoder.decode(frame.address, frame.rtr, frame.data)
+            out.append({
+                "measurement": decoded["name"],
+                "time": int(frame.timestamp * 1e9),
+                "tags": {"board": decoded["board"], "name": "bench", "rtr": str(frame.rtr), "origin": "device"},
+                "fields": decoded["data"]
+            })
+        return out
+
+    def after(frames):
+        return [decoder.decode_frame(f) for f in frames]
+
+    def after_values(frames):
+        out = after(frames)
+        for d in out:
+            d.values
+        return out
+
+    def measure(build, frames):
+        tracemalloc.start()
+        out = build(frames)
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        stats = snapshot.statistics('filename')
+        return out, sum(s.size for s in stats), sum(s.count for s in stats)
+
+    def report(label, size, count):
+        scale = 100000.0 / args.frames
+        print("%-14s %8.1f MB %10.0f objects  per 100k frames" % (label, size * scale / 1e6, count * scale))
+
+    frames, size, count = measure(lambda stream: SkynetFrameDecoder().feed(stream), stream)
+    old, old_size, old_count = measure(
+        lambda stream: [LegacyFrame(f.timestamp, f.address, f.rtr, f.length, list(f.data))
+                        for f in SkynetFrameDecoder().feed(stream)], stream)
+    report("frames before", old_size, old_count)
+    report("frames after", size, count)
+
+    # decoded, on top of the frames themselves
+    for label, build in (("before", before), ("after", after), ("after+values", after_values)):
+        out, size, count = measure(build, frames)
+        report(label, size, count)
+
+
+def bench_logger(args):
+    import json
+    import tempfile
+    from skynet_frame import SkyNetFrameBatch
+    from logger_influx import SkyNetDBLogger
+
+    defs = bench_definitions()
+    definitions = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+    json.dump(defs, definitions)
+    definitions.close()
+
+    stub = StubInflux(delay=args.delay)
+
+    class DB:
+        client = stub.client()
+
+    conn = StubConnection()
+    logger = SkyNetDBLogger("bench", conn, DB, definitions_file=definitions.name)
+    logger.start()
+
+    # the serial side hands over a batch per read; pace them at --rate frames/s
+    frames = packet_frames(defs, args.frames)
+    batches = []
+    for i in range(0, len(frames), args.batch):
+        batches.append(SkyNetFrameBatch.from_frames(
+            [(0.0, a, r, len(d), d) for a, r, d in frames[i:i + args.batch]]))
+
+    start = time.time()
+    for i, batch in enumerate(batches):
+        conn.listener(batch)
+        delay = start + (i + 1) * args.batch / args.rate - time.time()
+        if delay > 0:
+            time.sleep(delay)
+    logger.stop()
+    elapsed = time.time() - start
+
+    stats = logger.stats()
+    print("%i points in %i writes over %.2f s (stub saw %i lines, %.1f MB)" %
+          (stats["points"], stats["writes"], elapsed, stub.lines, stub.bytes / 1e6))
+    for name in ("batch_size", "flush_latency"):
+        h = stats[name]
+        print("%-14s mean %-10.4g max %-10.4g %s" % (name, h["mean"], h["max"],
+                                                    " ".join("<=%s:%i" % (b, c) for b, c in h["buckets"] if c)))
+
+    stub.close()
+    os.unlink(definitions.name)
+
+
+def bench_pool(args):
+    import json
+    import tempfile
+    from skynet_frame import SkyNetFrameBatch
+    from skynet_writer import SkyNetWriterPool
+    from logger_influx import SkyNetDBLogger
+
+    defs = bench_definitions()
+    definitions = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+    json.dump(defs, definitions)
+    definitions.close()
+
+    frames = packet_frames(defs, args.frames)
+    batches = []
+    for i in range(0, len(frames), args.batch):
+        batches.append(SkyNetFrameBatch.from_frames(
+            [(i + j, a, r, len(d), d) for j, (a, r, d) in enumerate(frames[i:i + args.batch])]))
+
+    print("server: %.1f ms per write + %.0f us per line, %i cores" %
+          (args.delay * 1e3, args.line_cost * 1e6, args.cores))
+
+    for workers in [0] + args.workers:
+        stub = StubInflux(delay=args.delay, line_cost=args.line_cost, cores=args.cores)
+
+        class DB:
+            client = stub.client()
+
+        pool = SkyNetWriterPool(stub.client, workers) if workers else None
+        conn = StubConnection()
+        logger = SkyNetDBLogger("bench", conn, DB, pool=pool, definitions_file=definitions.name)
+        logger.start()
+
+        # as fast as the logger takes them
+        start = time.time()
+        for batch in batches:
+            conn.listener(batch)
+            while len(logger._pending) > 200:
+                time.sleep(0.001)
+        logger.stop()
+        elapsed = time.time() - start
+
+        if pool is not None:
+            pool.stop()
+            stats = pool.stats()
+            in_flight = "in flight max %i mean %.2f" % (stats["max_in_flight"], stats["in_flight_at_send"]["mean"])
+        else:
+            in_flight = "in flight 1"
+
+        print("%-14s %8.0f points/s  %4i writes  %s%s" %
+              ("%i workers" % workers if workers else "logger thread", stub.lines / elapsed, stub.writes, in_flight,
+               "" if stub.lines == len(frames) else "  LOST %i" % (len(frames) - stub.lines)))
+        stub.close()
+
+    os.unlink(definitions.name)
+
+
+def bench_spool(args):
+    import json
+    import shutil
+    import tempfile
+    from skynet_frame import SkyNetFrameBatch
+    from skynet_spool import SkyNetSpool
+    from logger_influx import SkyNetDBLogger
+
+    defs = bench_definitions()
+    definitions = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+    json.dump(defs, definitions)
+    definitions.close()
+    directory = tempfile.mkdtemp()
+
+    stub = StubInflux()
+
+    class DB:
+        client = stub.client()
+
+    conn = StubConnection()
+    spool = SkyNetSpool(directory, segment_bytes=args.segment << 10, max_bytes=args.max << 10)
+    logger = SkyNetDBLogger("bench", conn, DB, spool=spool, definitions_file=definitions.name)
+    logger.RETRY_MIN = logger.RETRY_MAX = 0.5
+    logger.REPLAY_RATE = args.replay_rate << 10
+    logger.start()
+
+    frames = packet_frames(defs, args.frames)
+    batches = []
+    for i in range(0, len(frames), args.batch):
+        batches.append(SkyNetFrameBatch.from_frames(
+            [(i + j, a, r, len(d), d) for j, (a, r, d) in enumerate(frames[i:i + args.batch])]))
+
+    # influx goes away for the middle third of the run
+    start = time.time()
+    for i, batch in enumerate(batches):
+        if i == len(batches) // 3:
+            stub.stop()
+            print("influx down at %.2f s" % (time.time() - start))
+        elif i == 2 * len(batches) // 3:
+            stub.up()
+            print("influx up at %.2f s, %i segments, %.1f kB spooled" %
+                  (time.time() - start, spool.stats()["segments"], spool.stats()["bytes"] / 1e3))
+        conn.listener(batch)
+        delay = start + (i + 1) * args.batch / args.rate - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    up = time.time()
+    while spool.stats()["replayed"] + spool.stats()["dropped"] < spool.stats()["spooled"] and time.time() - up < 60:
+        time.sleep(0.05)
+    print("spool drained %.2f s after the last frame" % (time.time() - up))
+    logger.stop()
+
+    stats = logger.stats()
+    print("%i frames, %i points written in %i writes, %i errors (stub saw %i lines)" %
+          (len(frames), stats["points"], stats["writes"], stats["errors"], stub.lines))
+    print("spool: %s" % json.dumps(stats["spool"]))
+    # points dropped to keep the spool under --max are the only loss allowed
+    lost = len(frames) - stub.lines
+    left = os.listdir(directory)
+    if lost:
+        print("LOST %i points (%i dropped by the spool)" % (lost, stats["spool"]["dropped"]))
+    if left:
+        print("spool directory not empty: %s" % left)
+
+    stub.close()
+    shutil.rmtree(directory)
+    os.unlink(definitions.name)
+
+    if lost != stats["spool"]["dropped"] or left:
+        raise SystemExit(1)
+
+
+def bench_lines(args):
+    import json
+    from influxdb.line_protocol import make_lines
+    from skynet_parse import SkynetDecode
+    from skynet_line import SkyNetLineEncoder
+
+    defs = bench_definitions()
+    decoder = SkynetDecode(io.StringIO(json.dumps(defs)))
+    frames = packet_frames(defs, args.points)
+    decoded = [(i * 0.001, a, r, decoder.decode_values(a, decoder.unpack(a, d))) for i, (a, r, d) in enumerate(frames)]
+
+    start = time.time()
+    points = [{
+        "measurement": decoder.packets_by_address[a]["name"],
+        "time": int(t * 1e9),
+        "tags": {"board": decoder.packets_by_address[a]["board"], "name": "bench", "rtr": str(r), "origin": "device"},
+        "fields": fields
+    } for t, a, r, fields in decoded]
+    dicts_time = time.time() - start
+
+    start = time.time()
+    before = make_lines({"points": points}).encode('utf-8')
+    make_lines_time = time.time() - start
+
+    rows = [(t, a, r, list(fields.values())) for t, a, r, fields in decoded]
+    encoder = SkyNetLineEncoder("bench")
+    encoder.update(decoder, 1)
+
+    start = time.time()
+    out = bytearray()
+    encode = encoder.encode
+    for t, a, r, values in rows:
+        encode(out, a, r, "device", t, values)
+    encoder_time = time.time() - start
+
+    if bytes(out) != before:
+        print("MISMATCH between make_lines and the encoder")
+    print("point dicts  %8.3f s" % dicts_time)
+    print("make_lines   %8.3f s  %10.0f points/s" % (make_lines_time, len(rows) / make_lines_time))
+    print("encoder      %8.3f s  %10.0f points/s" % (encoder_time, len(rows) / encoder_time))
+    print("speedup      %8.1fx (%.1fx counting the point dicts)" %
+          (make_lines_time / encoder_time, (make_lines_time + dicts_time) / encoder_time))
+
+
+def bench_gzip(args):
+    import json
+    from skynet_parse import SkynetDecode
+    from skynet_line import SkyNetLineEncoder
+
+    defs = bench_definitions()
+    decoder = SkynetDecode(io.StringIO(json.dumps(defs)))
+    encoder = SkyNetLineEncoder("bench")
+    encoder.update(decoder, 1)
+
+    # logger-sized write bodies, and a query answer of --rows points
+    bodies = []
+    frames = packet_frames(defs, args.writes * args.points)
+    for i in range(0, len(frames), args.points):
+        out = bytearray()
+        for j, (a, r, d) in enumerate(frames[i:i + args.points]):
+            encoder.encode(out, a, r, "device", (i + j) * 0.001, decoder.field_values(a, decoder.unpack(a, d)))
+        bodies.append(bytes(out))
+
+    values = [["2016-01-01T00:00:%09.6fZ" % (i * 0.001), i * 0.5, "bench", "node"] for i in range(args.rows)]
+    result = json.dumps({"results": [{"series": [{"name": "bench", "columns": ["time", "value", "name", "board"],
+                                                  "values": values}]}]}).encode('utf-8')
+
+    stub = StubInflux(bandwidth=args.bandwidth * 1e6 / 8 if args.bandwidth else None)
+    stub.result = result
+    raw = sum(len(b) for b in bodies)
+
+    print("link %s, %i writes of %i points (%.2f MB), query of %i rows (%.2f MB)" %
+          ("%g Mbit/s" % args.bandwidth if args.bandwidth else "unlimited",
+           len(bodies), args.points, raw / 1e6, args.rows, len(result) / 1e6))
+
+    # requests already asks for gzipped responses by default; "plain" turns
+    # that off to show what it is worth
+    for mode in ("plain", "default", "gzip"):
+        client = stub.client(gzip=mode == "gzip")
+        if mode == "plain":
+            client._session.headers['Accept-Encoding'] = 'identity'
+        stub.bytes = stub.sent = 0
+
+        start = time.time()
+        for body in bodies:
+            client.write(body, params={'db': 'skynet'}, protocol='line')
+        write_time = time.time() - start
+        written = stub.bytes
+
+        start = time.time()
+        for i in range(args.queries):
+            points = list(client.query("SELECT * FROM bench").get_points())
+        query_time = time.time() - start
+
+        print("%-7s write %7.2f MB on the wire (%4.1fx) %7.1f ms/write   query %7.2f MB (%4.1fx) %7.1f ms/query" %
+              (mode, written / 1e6, raw / written, write_time / len(bodies) * 1e3,
+               stub.sent / args.queries / 1e6, len(result) * args.queries / stub.sent,
+               query_time / args.queries * 1e3))
+
+        if len(points) != args.rows:
+            print("query returned %i points" % len(points))
+
+    stub.close()
+
+
+def bench_capture(args):
+    frames = random_frames(args.frames)
+    stream = b''.join(encode_frame(*f) for f in frames)
+
+    start = time.time()
+    count = 0
+    for batch in read_capture(io.BytesIO(stream)):
+        count += len(batch)
+    elapsed = time.time() - start
+
+    print("decoded %i frames, %.1f MB in %.2f s: %.0f frames/s, %.1f MB/s" %
+          (count, len(stream) / 1e6, elapsed, count / elapsed, len(stream) / 1e6 / elapsed))
+
+
+def bench_chunk(args):
+    from skynet_chunk import SkyNetChunkAssembler
+    from skynet_frame import SkyNetFrameBatch
+
+    # every chunk frame carries a 2 byte offset and 13 bytes of the block
+    r = random.Random(0)
+    chunks = [{"name": "chunk%i" % i, "board": "bench", "description": "", "address": 1024 + i, "size": args.size}
+              for i in range(args.chunks)]
+    blocks = {c["address"]: bytes(r.getrandbits(8) for i in range(c["size"])) for c in chunks}
+
+    frames = []
+    for offset in range(0, args.size, 13):
+        for c in chunks:
+            piece = blocks[c["address"]][offset:offset + 13]
+            frames.append((c["address"], False, [offset & 0xFF, offset >> 8] + list(piece)))
+    stream = b''.join(encode_frame(*f) for f in frames)
+
+    done = {}
+
+    def on_complete(chunk, data, started, finished):
+        done[chunk["address"]] = data.tobytes()
+
+    batches = [SkyNetFrameBatch.from_frames(b) for b in read_capture(io.BytesIO(stream))]
+    assembler = SkyNetChunkAssembler(chunks, on_complete)
+
+    start = time.time()
+    for batch in batches:
+        assembler.listener(batch)
+    elapsed = time.time() - start
+
+    if done != blocks:
+        print("MISMATCH between sent and reassembled blocks")
+
+    total = args.chunks * args.size
+    print("reassembled %i x %i byte chunks from %i frames in %.2f s: %.1f MB/s" %
+          (args.chunks, args.size, len(frames), elapsed, total / 1e6 / elapsed))
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    sub = p.add_subparsers(dest="bench")
+
+    sp = sub.add_parser("serial", help="receive throughput against a pty stand-in")
+    sp.add_argument("--frames", type=int, default=200000)
+    sp.set_defaults(func=bench_serial)
+
+    sp = sub.add_parser("aio", help="many ptys read from one asyncio loop")
+    sp.add_argument("--frames", type=int, default=50000)
+    sp.add_argument("--ports", type=int, default=8)
+    sp.set_defaults(func=bench_aio)
+
+    sp = sub.add_parser("ingest", help="decode scaling across worker processes")
+    sp.add_argument("--frames", type=int, default=100000)
+    sp.add_argument("--ports", type=int, default=4)
+    sp.set_defaults(func=bench_ingest)
+
+    sp = sub.add_parser("reconnect", help="loss and latency across pty unplugs")
+    sp.add_argument("--cycles", type=int, default=5)
+    sp.add_argument("--interval", type=float, default=1.0)
+    sp.add_argument("--rate", type=float, default=1000)
+    sp.set_defaults(func=bench_reconnect)
+
+    sp = sub.add_parser("send", help="transmit throughput against a pty stand-in")
+    sp.add_argument("--frames", type=int, default=100000)
+    sp.set_defaults(func=bench_send)
+
+    sp = sub.add_parser("decode", help="SkynetDecode.decode over a mix of packet types")
+    sp.add_argument("--frames", type=int, default=200000)
+    sp.set_defaults(func=bench_decode)
+
+    sp = sub.add_parser("frames", help="memory and objects kept per decoded frame")
+    sp.add_argument("--frames", type=int, default=100000)
+    sp.set_defaults(func=bench_frames)
+
+    sp = sub.add_parser("logger", help="SkyNetDBLogger batching against a stub influx server")
+    sp.add_argument("--frames", type=int, default=100000)
+    sp.add_argument("--rate", type=float, default=20000, help="frames/s handed to the logger")
+    sp.add_argument("--batch", type=int, default=50, help="frames per listener call")
+    sp.add_argument("--delay", type=float, default=0.0, help="stub server time per write")
+    sp.set_defaults(func=bench_logger)
+
+    sp = sub.add_parser("pool", help="logger write throughput across writer pool sizes against a stub influx")
+    sp.add_argument("--frames", type=int, default=100000)
+    sp.add_argument("--batch", type=int, default=100, help="frames per serial read")
+    sp.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    sp.add_argument("--delay", type=float, default=0.005, help="server time per write, s")
+    sp.add_argument("--line-cost", type=float, default=0.0001, help="server time per line, s")
+    sp.add_argument("--cores", type=int, default=4, help="writes the server handles at once")
+    sp.set_defaults(func=bench_pool)
+
+    sp = sub.add_parser("spool", help="logger spooling to disk through an influx outage")
+    sp.add_argument("--frames", type=int, default=30000)
+    sp.add_argument("--rate", type=float, default=10000, help="frames per second")
+    sp.add_argument("--batch", type=int, default=100, help="frames per serial read")
+    sp.add_argument("--segment", type=int, default=64, help="spool segment size, kB")
+    sp.add_argument("--max", type=int, default=1 << 20, help="spool size limit, kB")
+    sp.add_argument("--replay-rate", type=int, default=2048, help="spool replay rate, kB/s")
+    sp.set_defaults(func=bench_spool)
+
+    sp = sub.add_parser("lines", help="line protocol encoding against make_lines")
+    sp.add_argument("--points", type=int, default=100000)
+    sp.set_defaults(func=bench_lines)
+
+    sp = sub.add_parser("gzip", help="wire size and latency of gzipped writes and queries against a stub influx")
+    sp.add_argument("--writes", type=int, default=20)
+    sp.add_argument("--points", type=int, default=5000, help="points per write")
+    sp.add_argument("--rows", type=int, default=50000, help="points in the query answer")
+    sp.add_argument("--queries", type=int, default=5)
+    sp.add_argument("--bandwidth", type=float, default=20, help="link speed, Mbit/s (0 for none)")
+    sp.set_defaults(func=bench_gzip)
+
+    sp = sub.add_parser("capture", help="offline decode throughput of a raw capture")
+    sp.add_argument("--frames", type=int, default=1000000)
+    sp.set_defaults(func=bench_capture)
+
+    sp = sub.add_parser("chunk", help="chunk transfer reassembly throughput")
+    sp.add_argument("--chunks", type=int, default=16)
+    sp.add_argument("--size", type=int, default=65536)
+    sp.set_defaults(func=bench_chunk)
+
+    args = p.parse_args()
+    if not hasattr(args, "func"):
+        p.print_help()
+    else:
+        args.func(args)
@@ -0,0 +1,176 @@
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# Chunk transfers: a board sends a `size`-byte block (calibration table,
+# trace buffer, ...) on its chunk address as a run of frames. Each frame's
+# payload is a little-endian uint16 byte offset followed by the bytes that
+# belong at that offset. Frames may repeat or arrive out of order; the
+# transfer is complete once every byte of the block has been received.
+
+import json
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+
+OFFSET_SIZE = 2
+
+
+class SkyNetChunkTransfer:
+
+    def __init__(self, chunk, started):
+        self.chunk = chunk
+        self.started = started
+        # local monotonic time, since frame timestamps may come from a replay
+        self.updated = time.monotonic()
+        self.buffer = bytearray(chunk["size"])
+        # one byte per byte of the block, set once it has been received
+        self.mask = bytearray(chunk["size"])
+        self.received = 0
+
+
+class SkyNetChunkAssembler:
+    # Collects chunk frames into preallocated buffers keyed by address (one
+    # address per board/chunk). When a block is complete, on_complete(chunk,
+    # data, started, finished) gets a memoryview of the buffer; copy it if it
+    # must outlive the callback. Memory is bounded by max_bytes of partial
+    # transfers: the oldest partial is dropped to make room for a new one.
+
+    def __init__(self, chunks, on_complete, timeout=10.0, max_bytes=16 << 20):
+        self.chunks_by_address = {c["address"]: c for c in chunks}
+        self.on_complete = on_complete
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+
+        self._transfers = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+
+        self.completed = 0
+        self.timeouts = 0
+        self.evictions = 0
+        self.bad_frames = 0
+        self.bytes_completed = 0
+
+    @classmethod
+    def from_file(cls, path, on_complete, **kwargs):
+        with open(path) as f:
+            return cls(json.load(f), on_complete, **kwargs)
+
+    def stats(self):
+        return {
+            "in_progress": len(self._transfers),
+            "buffered_bytes": self._bytes,
+            "completed": self.completed,
+            "bytes_completed": self.bytes_completed,
+            "timeouts": self.timeouts,
+            "evictions": self.evictions,
+            "bad_frames": self.bad_frames
+        }
+
+    def listener(self, batch):
+        # for add_batch_listener: pick the chunk frames out of a batch
+        chunks = self.chunks_by_address
+        payload = batch.payload
+        offsets = batch.offsets
+
+        for i, address in enumerate(batch.addresses):
+            if address in chunks:
+                self.feed(batch.timestamps[i], address, payload[offsets[i]:offsets[i + 1]])
+
+        self.expire()
+
+    def feed(self, timestamp, address, data):
+        chunk = self.chunks_by_address.get(address)
+        if chunk is None:
+            return
+
+        if len(data) <= OFFSET_SIZE:
+            self.bad_frames += 1
+            return
+
+        offset = data[0] | (data[1] << 8)
+        n = len(data) - OFFSET_SIZE
+
+        if offset + n > chunk["size"]:
+            self.bad_frames += 1
+            return
+
+        with self._lock:
+            t = self._transfers.get(address)
+            now = time.monotonic()
+
+            # a transfer that went quiet for longer than the timeout is
+            # stale even if expire() hasn't got to it yet; the board has
+            # started the block over
+            if t is not None and now - t.updated > self.timeout:
+                self._drop(address)
+                self.timeouts += 1
+                t = None
+
+            if t is None:
+                t = self._start(address, chunk, timestamp)
+
+            # repeats and overlapping frames only count the bytes that are new
+            t.buffer[offset:offset + n] = data[OFFSET_SIZE:]
+            t.received += n - t.mask.count(1, offset, offset + n)
+            t.mask[offset:offset + n] = b'\x01' * n
+            t.updated = now
+
+            if t.received < chunk["size"]:
+                return
+
+            self._transfers.pop(address)
+            self._bytes -= chunk["size"]
+            self.completed += 1
+            self.bytes_completed += chunk["size"]
+
+        self.on_complete(chunk, memoryview(t.buffer), t.started, timestamp)
+
+    def expire(self):
+        now = time.monotonic()
+        with self._lock:
+            for address, t in list(self._transfers.items()):
+                if now - t.updated > self.timeout:
+                    self._drop(address)
+                    self.timeouts += 1
+
+    def _start(self, address, chunk, timestamp):
+        while self._transfers and self._bytes + chunk["size"] > self.max_bytes:
+            oldest = next(iter(self._transfers))
+            self._drop(oldest)
+            self.evictions += 1
+
+        t = SkyNetChunkTransfer(chunk, timestamp)
+        self._transfers[address] = t
+        self._bytes += chunk["size"]
+        return t
+
+    def _drop(self, address):
+        t = self._transfers.pop(address)
+        self._bytes -= t.chunk["size"]
+
+
+class SkyNetChunkFileSink:
+    # on_complete target that writes each finished block straight from the
+    # reassembly buffer to <directory>/<name>_<board>_<chunk>_<time>.bin
+
+    def __init__(self, directory, name=''):
+        self.directory = directory
+        self.name = name
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, chunk, data, started, finished):
+        path = os.path.join(self.directory, "%s_%s_%s_%i.bin" %
+                            (self.name, chunk["board"], chunk["name"], finished))
+        with open(path, 'wb') as f:
+            f.write(data)
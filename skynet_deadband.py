@@ -0,0 +1,89 @@
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+
+class SkyNetDeadband:
+    # Change-only logging for packets that ask for it in their definitions.
+    # A packet with a `heartbeat` (seconds) or a `deadband` on any field is
+    # written when some field has moved past its deadband since the last
+    # written sample (fields without one: any change), and otherwise only
+    # once per heartbeat as a keep-alive. Other packets always pass.
+
+    DEFAULT_HEARTBEAT = 10.0
+
+    def __init__(self, scaled=False):
+        # scaled: values are checked after scaling; otherwise deadbands are
+        # converted to raw units
+        self.scaled = scaled
+        self.version = None
+        self.rules = {}
+        self._last = {}
+
+        self.samples = 0
+        self.written = 0
+
+    def update(self, decoder, version):
+        # recompile the rules when the definitions change
+        if version == self.version:
+            return
+
+        rules = {}
+
+        for address, d in decoder.packets_by_address.items():
+            deadbands = {}
+
+            for field in d["data"]:
+                deadband = field.get("deadband")
+                if deadband is not None and not self.scaled and field.get("scale"):
+                    deadband = deadband / abs(field["scale"])
+                deadbands[field["name"]] = deadband
+
+            if d.get("heartbeat") is None and not any(v is not None for v in deadbands.values()):
+                continue
+
+            # one deadband per decoded value; bits of a bitfield have none
+            rules[address] = (d.get("heartbeat") or self.DEFAULT_HEARTBEAT,
+                              tuple(deadbands.get(name) or 0 for name in decoder.field_names(address)))
+
+        self.rules = rules
+        self._last = {}
+        self.version = version
+
+    def keep(self, address, timestamp, values):
+        # values in the decoder's field_names() order
+        self.samples += 1
+        rule = self.rules.get(address)
+
+        if rule is not None:
+            heartbeat, deadbands = rule
+            last = self._last.get(address)
+
+            if last is not None and timestamp - last[0] < heartbeat:
+                for v, l, deadband in zip(values, last[1], deadbands):
+                    # NaN never compares within the deadband
+                    if v != l and not abs(v - l) <= deadband:
+                        break
+                else:
+                    return False
+
+            self._last[address] = (timestamp, values)
+
+        self.written += 1
+        return True
+
+    def stats(self):
+        return {
+            "samples": self.samples,
+            "written": self.written,
+            "suppressed": self.samples - self.written,
+            "reduction": self.samples / self.written if self.written else 1.0
+        }
@@ -0,0 +1,144 @@
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+from bisect import bisect_left
+from collections import deque
+from threading import Lock
+
+
+class SkyNetDedup:
+    # Shared by the loggers of every port, for gateways that sit on the same
+    # bus. Every frame that passes is remembered as a copy waiting for its
+    # twin: per (address, rtr, payload), the arrival times from each port
+    # (source). A frame is a duplicate, and is dropped, when another port
+    # has a waiting copy that arrived within `window` seconds of it; that
+    # copy is then used up. So a packet repeating the same payload at 100 Hz
+    # is still written once per repeat, however the ports' batches
+    # interleave. Copies are kept for `window` plus `delay` seconds behind
+    # the newest frame, `delay` being how far one port's batches may lag
+    # another's; `max_entries` bounds memory if that is too long.
+
+    def __init__(self, window=0.05, delay=1.0, max_entries=1 << 16):
+        self.window = window
+        self.delay = delay
+        self.max_entries = max_entries
+
+        # key -> {source: ([arrival times, oldest first], [their copies])}
+        self._seen = {}
+        # every remembered copy, [timestamp, key, source, waiting], in arrival
+        # order; waiting goes False when a twin uses the copy up, so expiry
+        # knows it is gone already
+        self._order = deque()
+        self._latest = 0.0
+        self._lock = Lock()
+
+        self.frames = 0
+        self.duplicates = 0
+        self.overflows = 0
+        self.by_source = {}
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "duplicates": self.duplicates,
+            "overflows": self.overflows,
+            "entries": len(self._order),
+            "duplicates_by_source": dict(self.by_source)
+        }
+
+    def _forget(self):
+        copy = self._order.popleft()
+
+        if not copy[3]:
+            return
+
+        t, key, source, waiting = copy
+        copies = self._seen[key]
+        times, entries = copies[source]
+
+        i = bisect_left(times, t)
+        while entries[i] is not copy:
+            i += 1
+        del times[i]
+        del entries[i]
+
+        if not times:
+            del copies[source]
+            if not copies:
+                del self._seen[key]
+
+    def _first(self, source, timestamp, key):
+        copies = self._seen.get(key)
+
+        if copies is not None:
+            for other, (times, entries) in copies.items():
+                if other == source:
+                    continue
+                i = bisect_left(times, timestamp - self.window)
+                if i < len(times) and times[i] <= timestamp + self.window:
+                    del times[i]
+                    entries.pop(i)[3] = False
+                    if not times:
+                        del copies[other]
+                        if not copies:
+                            del self._seen[key]
+                    self.duplicates += 1
+                    self.by_source[source] = self.by_source.get(source, 0) + 1
+                    return False
+        else:
+            copies = self._seen[key] = {}
+
+        waiting = copies.get(source)
+        if waiting is None:
+            waiting = copies[source] = ([], [])
+        times, entries = waiting
+        copy = [timestamp, key, source, True]
+        # one port's frames arrive in time order, so this is nearly always
+        # an append
+        i = bisect_left(times, timestamp)
+        times.insert(i, timestamp)
+        entries.insert(i, copy)
+        self._order.append(copy)
+
+        if timestamp > self._latest:
+            self._latest = timestamp
+
+        oldest = self._latest - self.window - self.delay
+        order = self._order
+        while order and (order[0][0] < oldest or len(order) > self.max_entries):
+            if order[0][0] >= oldest:
+                self.overflows += 1
+            self._forget()
+
+        return True
+
+    def first(self, source, timestamp, address, rtr, data):
+        with self._lock:
+            self.frames += 1
+            return self._first(source, timestamp, (address, not not rtr, bytes(data)))
+
+    def filter_batch(self, source, batch):
+        # the SkyNetFrameBatch without the frames another port already passed
+        keep = []
+        payload = batch.payload
+        offsets = batch.offsets
+
+        with self._lock:
+            self.frames += len(batch)
+            for i, (t, a, r) in enumerate(zip(batch.timestamps, batch.addresses, batch.rtrs)):
+                if self._first(source, t, (a, not not r, payload[offsets[i]:offsets[i + 1]])):
+                    keep.append(i)
+
+        if len(keep) == len(batch):
+            return batch
+
+        return batch.take(keep)
@@ -0,0 +1,184 @@
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+from threading import Thread, Condition, current_thread
+from skynet_frame import SkyNetFrameBatch
+
+
+class SkyNetRing:
+    # Fixed-size frame ring with a single writer. The writer never waits on
+    # readers: each reader keeps its own cursor, and a reader that falls more
+    # than `size` frames behind loses the oldest ones.
+
+    def __init__(self, size=65536):
+        self.size = size
+        self.head = 0  # total number of frames ever published
+        self._slots = [None] * size
+        self._cond = Condition()
+
+    def publish(self, frames):
+        n = len(frames)
+        if n == 0:
+            return
+
+        with self._cond:
+            if n > self.size:
+                self.head += n - self.size
+                frames = frames[-self.size:]
+                n = self.size
+
+            i = self.head % self.size
+            first = min(n, self.size - i)
+            self._slots[i:i + first] = frames[:first]
+            self._slots[0:n - first] = frames[first:]
+            self.head += n
+
+            self._cond.notify_all()
+
+    def read(self, cursor, max_frames, timeout=None):
+        # returns (frames, new cursor, frames lost to overwrite)
+        with self._cond:
+            if self.head == cursor:
+                self._cond.wait(timeout)
+
+            dropped = 0
+            if self.head - cursor > self.size:
+                dropped = self.head - self.size - cursor
+                cursor = self.head - self.size
+
+            n = min(self.head - cursor, max_frames)
+            i = cursor % self.size
+            first = min(n, self.size - i)
+            frames = self._slots[i:i + first] + self._slots[0:n - first]
+
+        return frames, cursor + n, dropped
+
+    def wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+
+class SkyNetSubscriber(Thread):
+
+    def __init__(self, ring, callback, batch=None, max_batch=4096):
+        super(SkyNetSubscriber, self).__init__()
+        self.daemon = True
+
+        self.ring = ring
+        self.callback = callback
+        self.batch = batch
+        self.max_batch = max_batch
+        self.name = getattr(callback, '__qualname__', repr(callback))
+
+        self.cursor = ring.head
+        self.running = False
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_lag = 0
+
+    @property
+    def lag(self):
+        return self.ring.head - self.cursor
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "lag": self.lag,
+            "max_lag": self.max_lag
+        }
+
+    def start(self):
+        self.running = True
+        super(SkyNetSubscriber, self).start()
+
+    def stop(self):
+        self.running = False
+        self.ring.wake()
+        if current_thread() is not self:
+            self.join()
+
+    def deliver(self, frames):
+        # batch, if given, turns the list of frames into what the callback takes
+        if self.batch is not None:
+            self.callback(self.batch(frames))
+        else:
+            # per-frame listeners predate memoryview payloads and get a list,
+            # as they always did
+            for t, address, rtr, length, data in frames:
+                self.callback(t, address, rtr, length, list(data))
+
+    def run(self):
+        while self.running:
+            lag = self.ring.head - self.cursor
+            if lag > self.max_lag:
+                self.max_lag = lag
+
+            frames, self.cursor, dropped = self.ring.read(self.cursor, self.max_batch, 0.5)
+            self.dropped += dropped
+
+            if not frames or not self.running:
+                continue
+
+            try:
+                self.deliver(frames)
+            except Exception as e:
+                self.errors += 1
+                print(e)
+
+            self.delivered += len(frames)
+
+
+class SkyNetDispatch:
+    # Fans frames out from a reader thread to listeners, each running in
+    # its own subscriber thread so a slow listener never stalls the reader.
+
+    def __init__(self, ring_size=65536):
+        self.ring = SkyNetRing(ring_size)
+        self.subscribers = {}
+
+    def add_listener(self, listener):
+        # listener(timestamp, address, rtr, data_length, data_bytes) per frame,
+        # data_bytes being a list of ints
+        s = SkyNetSubscriber(self.ring, listener)
+        self.subscribers[listener] = s
+        s.start()
+
+    def add_batch_listener(self, listener):
+        # listener(batch) once per wakeup, with a SkyNetFrameBatch
+        s = SkyNetSubscriber(self.ring, listener, batch=SkyNetFrameBatch.from_frames)
+        self.subscribers[listener] = s
+        s.start()
+
+    def add_list_listener(self, listener):
+        # listener(list) once per wakeup, with the published items as-is
+        s = SkyNetSubscriber(self.ring, listener, batch=list)
+        self.subscribers[listener] = s
+        s.start()
+
+    def remove_listener(self, listener):
+        s = self.subscribers.pop(listener, None)
+        if s is not None:
+            s.stop()
+
+    def publish(self, frames):
+        self.ring.publish(frames)
+
+    def lag(self):
+        # frames still waiting for the slowest listener
+        return max([s.lag for s in list(self.subscribers.values())] + [0])
+
+    def stats(self):
+        return [s.stats() for s in list(self.subscribers.values())]
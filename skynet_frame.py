@@ -0,0 +1,289 @@
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import time
+from array import array
+from functools import lru_cache
+from itertools import accumulate, chain
+
+ESCAPE_CHARACTER = b'\x7D'
+START_CHARACTER = b'\x7E'
+ESCAPE_VALUE = 0x7D
+START_VALUE = 0x7E
+
+class SkyNetFrame:
+    # One received frame. The payload is not copied out of the buffer it was
+    # decoded into; `data` is a memoryview of it, made only when asked for.
+    # Unpacks in listener order, so `t, address, rtr, length, data = frame`
+    # and l(*frame) work.
+
+    __slots__ = ('timestamp', 'address', 'rtr', 'length', 'buffer', 'start')
+
+    def __init__(self, timestamp, address, rtr, length, buffer, start):
+        self.timestamp = timestamp
+        self.address = address
+        self.rtr = rtr
+        self.length = length
+        self.buffer = buffer
+        self.start = start
+
+    @property
+    def data(self):
+        return memoryview(self.buffer)[self.start:self.start + self.length]
+
+    def __iter__(self):
+        return iter((self.timestamp, self.address, self.rtr, self.length, self.data))
+
+    def __repr__(self):
+        return "SkyNetFrame(%r, %r, %r, %r, %r)" % (self.timestamp, self.address, self.rtr, self.length,
+                                                     list(self.data))
+
+
+class SkyNetFrameBatch:
+    # Column layout of a run of frames: parallel arrays of metadata plus all
+    # payloads packed back to back in one buffer, indexed by `offsets`.
+
+    def __init__(self, timestamps, addresses, rtrs, lengths, payload):
+        self.timestamps = timestamps
+        self.addresses = addresses
+        self.rtrs = rtrs
+        self.lengths = lengths
+        self.payload = payload
+        self.offsets = array('I', accumulate(lengths, initial=0))
+
+    @classmethod
+    def from_frames(cls, frames):
+        if not frames:
+            return cls(array('d'), array('H'), array('B'), array('B'), b'')
+
+        if isinstance(frames[0], SkyNetFrame):
+            return cls(array('d', [f.timestamp for f in frames]), array('H', [f.address for f in frames]),
+                       array('B', [f.rtr for f in frames]), array('B', [f.length for f in frames]),
+                       b''.join([f.buffer[f.start:f.start + f.length] for f in frames]))
+
+        timestamps, addresses, rtrs, lengths, data = zip(*frames)
+        return cls(array('d', timestamps), array('H', addresses), array('B', rtrs),
+                   array('B', lengths), bytes(chain.from_iterable(data)))
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def take(self, indices):
+        # new batch of just the frames at `indices`
+        return SkyNetFrameBatch(array('d', [self.timestamps[i] for i in indices]),
+                                array('H', [self.addresses[i] for i in indices]),
+                                array('B', [self.rtrs[i] for i in indices]),
+                                array('B', [self.lengths[i] for i in indices]),
+                                b''.join([self.data(i) for i in indices]))
+
+    def data(self, i):
+        return self.payload[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self):
+        # per-frame view, for listeners that still want one call per frame;
+        # the frames share the batch's payload buffer
+        payload = self.payload
+        for t, a, r, n, o in zip(self.timestamps, self.addresses, self.rtrs, self.lengths, self.offsets):
+            yield SkyNetFrame(t, a, not not r, n, payload, o)
+
+
+def encode_frame(address, rtr, data):
+    unescaped = [address // 8, (address % 8) * 32 + (16 if rtr else 0) + len(data)] + list(data)
+    unescaped.append(sum(unescaped) % 256)
+
+    out = bytearray(START_CHARACTER)
+    for d in unescaped:
+        if d == ESCAPE_VALUE or d == START_VALUE:
+            out += ESCAPE_CHARACTER
+            d ^= 0x20
+        out.append(d)
+    return bytes(out)
+
+
+# Periodic command packets repeat the same payloads, so keep their encoded
+# bytes around. Takes the data as a tuple so it can be hashed.
+encode_frame_cached = lru_cache(maxsize=4096)(encode_frame)
+
+
+class SkyNetClock:
+    # Wall-clock seconds that never step backwards: time.monotonic() anchored
+    # to time.time() once, when the clock is created or re-anchored.
+
+    def __init__(self):
+        self.anchor()
+
+    def anchor(self):
+        self._wall = time.time()
+        self._mono = time.monotonic()
+
+    def now(self):
+        return self._wall + (time.monotonic() - self._mono)
+
+
+class SkynetFrameDecoder:
+
+    def __init__(self, byte_time=0.0):
+        # seconds per byte on the wire (10 bits per byte at 8N1); with 0
+        # every frame in a chunk gets the timestamp passed to feed()
+        self.byte_time = byte_time
+
+        # frames dropped for a bad CRC, partial frames cut off by a new
+        # start-of-frame, and bytes that did not end up in a good frame
+        self.crc_errors = 0
+        self.resyncs = 0
+        self.byte_errors = 0
+        self.reset()
+
+    def reset(self):
+        # drop any partial frame and wait for the next start-of-frame
+        self._synced = False
+        self._escaped = False
+        self._emitted = False
+        self._frame = bytearray()
+        self._timestamp = 0
+        self._last_read = 0
+        self._last_time = 0
+
+    def _unescape(self, piece):
+        # XOR the byte after each escape character. Back-to-back escapes
+        # collapse into one, and an escape at the end of a piece carries
+        # over into the next one.
+        if self._escaped:
+            piece = ESCAPE_CHARACTER + piece
+        elif ESCAPE_CHARACTER not in piece:
+            return piece
+
+        parts = piece.split(ESCAPE_CHARACTER)
+        out = bytearray(parts[0])
+        for p in parts[1:]:
+            if p:
+                out.append(p[0] ^ 0x20)
+                out += p[1:]
+        self._escaped = not parts[-1]
+        return out
+
+    def _append(self, piece, frames):
+        if not piece:
+            return
+
+        if self._emitted:
+            # only the escape state matters for bytes after the CRC
+            self._escaped = piece[-1] == ESCAPE_VALUE
+            self.byte_errors += len(piece)
+            return
+
+        self._frame += self._unescape(piece)
+        f = self._frame
+
+        # metadata, payload and CRC byte; anything after the CRC is ignored
+        if len(f) >= 3 and len(f) >= 3 + (f[1] & 15):
+            data_length = f[1] & 15
+            end = 2 + data_length
+            if sum(f[:end]) & 0xFF == f[end]:
+                frames.append(SkyNetFrame(self._timestamp, f[1] // 32 + f[0] * 8, not not (f[1] & 16),
+                                          data_length, bytes(f), 2))
+                self.byte_errors += len(f) - end - 1
+            else:
+                self.crc_errors += 1
+                self.byte_errors += len(f)
+            self._emitted = True
+
+    def feed(self, chunk, timestamp=0):
+        frames = []
+        pieces = bytes(chunk).split(START_CHARACTER)
+
+        # the first piece continues the frame from the previous call
+        if self._synced:
+            self._append(pieces[0], frames)
+        else:
+            self.byte_errors += len(pieces[0])
+            if len(pieces) > 1:
+                self._synced = True
+
+        if len(pieces) == 1:
+            self._last_read = timestamp
+            return frames
+
+        if self._frame and not self._emitted:
+            self.resyncs += 1
+            self.byte_errors += len(self._frame)
+
+        # Pieces between two start bytes in this chunk are whole frames. The
+        # CRC is the sum of the metadata and data bytes, checked with one
+        # C-level sum() per frame.
+        append = frames.append
+        crc_errors = 0
+        resyncs = 0
+        byte_errors = 0
+
+        # A frame is stamped with the arrival of its start byte. The last byte
+        # of the chunk came in no later than `timestamp` and the bytes before
+        # it at the line rate, so work back from there by byte offset. A late
+        # wakeup can't push a frame before the previous read or frame.
+        byte_time = self.byte_time
+        last_byte = len(chunk) - 1
+        floor = max(self._last_read, self._last_time)
+        pos = len(pieces[0])
+
+        for f in pieces[1:-1]:
+            t = timestamp - (last_byte - pos) * byte_time
+            if t < floor:
+                t = floor
+            floor = t
+            pos += len(f) + 1
+
+            if self._escaped or ESCAPE_CHARACTER in f:
+                f = self._unescape(f)
+            n = len(f)
+            if n >= 3 and n >= 3 + (f[1] & 15):
+                data_length = f[1] & 15
+                end = 2 + data_length
+                if sum(f[:end]) & 0xFF == f[end]:
+                    append(SkyNetFrame(t, f[1] // 32 + f[0] * 8, not not (f[1] & 16), data_length, f, 2))
+                    byte_errors += n - end - 1
+                else:
+                    crc_errors += 1
+                    byte_errors += n
+            elif n:
+                resyncs += 1
+                byte_errors += n
+
+        self.crc_errors += crc_errors
+        self.resyncs += resyncs
+        self.byte_errors += byte_errors
+
+        # the last piece is the start of a frame that may continue later
+        t = timestamp - (last_byte - pos) * byte_time
+        if t < floor:
+            t = floor
+        self._last_time = t
+        self._last_read = timestamp
+
+        self._frame = bytearray()
+        self._emitted = False
+        self._timestamp = t
+        self._append(pieces[-1], frames)
+
+        return frames
+
+
+def read_capture(f, chunk_size=1 << 20, decoder=None):
+    # decode a raw byte capture (file, socket makefile, pty) a chunk at a time
+    if decoder is None:
+        decoder = SkynetFrameDecoder()
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        frames = decoder.feed(chunk)
+        if frames:
+            yield frames
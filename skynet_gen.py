@@ -17,6 +17,7 @@ import yaml
 import sys
 import json
 import os
+import hashlib
 
 c_types = {
     'uint8_t': 1,
@@ -25,11 +26,29 @@ c_types = {
     'int16_t': 2,
     'uint32_t': 4,
     'int32_t': 4,
-    # TODO: not supporting bitfields for now.  Should add back later.
-    # 'bitfield': 1,
+    'bitfield': 1,
     'float': 4
 }
 
+# word type carrying a bitfield, by its size in bytes
+bitfield_types = {
+    1: 'uint8_t',
+    2: 'uint16_t',
+    4: 'uint32_t'
+}
+
+
+# struct format characters for the generated python decoders
+py_formats = {
+    'uint8_t': 'B',
+    'int8_t': 'b',
+    'uint16_t': 'H',
+    'int16_t': 'h',
+    'uint32_t': 'I',
+    'int32_t': 'i',
+    'float': 'f'
+}
+
 
 class TermColors:
     HEADER = '\033[95m'
@@ -103,6 +122,12 @@ class SkyNetPacket:
         self.endian = packet.get('endian')
         self.data = []
 
+        # host side logging: with a heartbeat (seconds), samples whose fields
+        # all stay within their deadband are only written once per heartbeat
+        self.heartbeat = packet.get('heartbeat')
+        if self.heartbeat is not None and self.heartbeat <= 0:
+            raise Exception('Packet %s heartbeat must be positive' % name)
+
         for field in packet.get('data'):
             d = SkyNetData(
                 field.get('name'),
@@ -110,13 +135,16 @@ class SkyNetPacket:
                 field.get('type'),
                 field.get('unit'),
                 field.get('scale'),
-                field.get('decimals'))
+                field.get('decimals'),
+                field.get('size'),
+                field.get('bits'),
+                field.get('deadband'))
             self.data.append(d)
 
     def get_parameters(self):
         params = []
         for d in self.data:
-            params.append(d.get_parameter())
+            params.extend(d.get_parameters())
         return ", ".join(params)
 
     def get_arguments(self):
@@ -131,19 +159,25 @@ class SkyNetPacket:
                 for offset in range(0, c_types[field.type]):
                     bytes.append('.b[' + str(offset) + ']=data[' + str(offset + byte_num) + ']')
                 arguments.append('((SkynetDataUnion_t){' + ', '.join(bytes) + ' }).f')
+            elif field.type == "bitfield":
+                for offset in range(0, field.size):
+                    bytes.append('(data[' + str(offset + byte_num) + ']<<' + str(offset*8) + ')')
+                word = '(' + field.word_type + ')(' + '|'.join(bytes) + ')'
+                for bit in field.bits:
+                    arguments.append('(%s)((%s >> %i) & 0x%x)' % (field.word_type, word, bit.shift, bit.mask))
             else:
                 for offset in range(0, c_types[field.type]):
                     bytes.append('(data[' + str(offset + byte_num) + ']<<' + str(offset*8) + ')')
                 arguments.append('(' + field.type + ')(' + '|'.join(bytes) + ')')
 
-            byte_num += c_types[field.type]
+            byte_num += field.size
 
         return ', '.join(arguments)
 
     def data_length(self):
         length = 0
         for field in self.data:
-            length += c_types[field.type]
+            length += field.size
         return length
 
     def get_data_copy(self):
@@ -151,9 +185,14 @@ class SkyNetPacket:
         txt = ""
 
         for field in self.data:
-            for i in range(0, c_types[field.type]):
+            if field.type == "bitfield":
+                word = ' | '.join('((%s)(%s_%s & 0x%x) << %i)' % (field.word_type, field.name, bit.name, bit.mask, bit.shift)
+                                  for bit in field.bits)
+            for i in range(0, field.size):
                 if field.type == "float":
                     txt += '    p.data[' + str(dlc) + '] = ((SkynetDataUnion_t){.f=' + field.name + '}).b[' + str(i) + '];\n'
+                elif field.type == "bitfield":
+                    txt += '    p.data[' + str(dlc) + '] = (' + word + ')>>' + str(i*8) + ';\n'
                 else:
                     txt += '    p.data[' +str(dlc) + '] = ' + field.name + '>>' + str(i*8) + ';\n'
                 dlc += 1
@@ -179,10 +218,30 @@ class SkyNetChunk:
         self.size = chunk.get('size')
         self.board = board
 
+        # chunk frames carry a 16-bit byte offset
+        if self.size is None or self.size <= 0 or self.size > pow(2, 16):
+            raise Exception('Chunk %s size must be between 1 and %i bytes' % (self.name, pow(2, 16)))
+
+
+class SkyNetBit:
+
+    def __init__(self, bit, shift):
+
+        name = bit.get('name')
+
+        if name is None or name is "":
+            raise Exception('Bit name is a required field.')
+
+        self.name = name
+        self.description = bit.get('description')
+        self.width = bit.get('width', 1)
+        self.shift = shift
+        self.mask = pow(2, self.width) - 1
+
 
 class SkyNetData:
 
-    def __init__(self, name, description, _type, unit, scale, decimals):
+    def __init__(self, name, description, _type, unit, scale, decimals, size=None, bits=None, deadband=None):
 
         if name is None or name is "":
             raise Exception('Data name is a required field.')
@@ -197,9 +256,42 @@ class SkyNetData:
             raise Exception('Unknown data type: %s' % _type)
 
         self.type = _type
+        self.size = c_types[_type]
+        self.bits = []
+
+        # smallest change worth logging, in scaled units
+        self.deadband = deadband
+        if deadband is not None and (deadband < 0 or _type == 'bitfield'):
+            raise Exception('Data %s deadband must be >= 0, and bitfields cannot have one' % name)
+
+        if _type == 'bitfield':
+            self.size = size or 1
+
+            if self.size not in bitfield_types:
+                raise Exception('Bitfield %s size must be 1, 2 or 4 bytes' % name)
+            if not bits:
+                raise Exception('Bitfield %s must list its bits' % name)
+            if scale is not None or decimals is not None:
+                raise Exception('Bitfield %s cannot have a scale or decimals' % name)
+
+            self.word_type = bitfield_types[self.size]
+
+            # bits are packed from the least significant end, in order
+            shift = 0
+            for bit in bits:
+                b = SkyNetBit(bit, shift)
+                if b.name in [other.name for other in self.bits]:
+                    raise Exception('Duplicate bit name: %s in bitfield %s' % (b.name, name))
+                self.bits.append(b)
+                shift += b.width
+
+            if shift > self.size * 8:
+                raise Exception('Bitfield %s needs %i bits but is only %i bytes' % (name, shift, self.size))
 
-    def get_parameter(self):
-        return "%s %s" % (self.type, self.name)
+    def get_parameters(self):
+        if self.type == 'bitfield':
+            return ["%s %s_%s" % (self.word_type, self.name, bit.name) for bit in self.bits]
+        return ["%s %s" % (self.type, self.name)]
 
 
 class SkyNetDefinition:
@@ -584,6 +676,11 @@ void orbit_init(SkynetSerialSendFxn send_serial, SkynetCanSendFxn send_can);
 """
         for p in sorted(packet_list.keys()):
             packet = packet_list[p]
+            for field in packet.data:
+                for bit in field.bits:
+                    prefix = ("%s_%s_%s_%s" % (packet.board, packet.name, field.name, bit.name)).upper()
+                    txt += "#define %s_SHIFT (%i)\n" % (prefix, bit.shift)
+                    txt += "#define %s_MASK (0x%x)\n" % (prefix, bit.mask << bit.shift)
             txt += "void orbit_%s_%s( %s, bool serial_only );\n" % (packet.board, packet.name, packet.get_parameters())
 
         txt += """
@@ -614,26 +711,148 @@ void orbit_init(SkynetSerialSendFxn send_serial, SkynetCanSendFxn send_can);
                 "data": []
             }
 
+            if packet.heartbeat is not None:
+                j["heartbeat"] = packet.heartbeat
+
             for field in packet.data:
-                j["data"].append({
+                f = {
                     "name": field.name,
                     "description": field.description,
                     "type": field.type,
                     "unit": field.unit,
                     "scale": field.scale,
                     "decimals": field.decimals
-                })
+                }
+                if field.deadband is not None:
+                    f["deadband"] = field.deadband
+                if field.type == "bitfield":
+                    f["size"] = field.size
+                    f["bits"] = [{
+                        "name": bit.name,
+                        "description": bit.description,
+                        "shift": bit.shift,
+                        "width": bit.width
+                    } for bit in field.bits]
+                j["data"].append(f)
             out.append(j)
 
         return out
 
+    def generate_chunk_list(self):
+
+        chunk_list = {}
+        out = []
+
+        for board_name in self.boards:
+            board = self.boards[board_name]
+            for chunk_name in board.chunks:
+                chunk = board.chunks[chunk_name]
+                chunk_list[chunk.address] = chunk
+
+        for c in sorted(chunk_list.keys()):
+            chunk = chunk_list[c]
+            out.append({
+                "name": chunk.name,
+                "board": chunk.board,
+                "description": chunk.description,
+                "address": chunk.address,
+                "size": chunk.size
+            })
+
+        return out
+
+    def generate_json_chunk_list(self, filename):
+        with open(filename, 'w') as f:
+            f.write(json.dumps(self.generate_chunk_list(), sort_keys=True, indent=4, separators=(',', ': ')))
+
     def generate_js_packet_list(self, filename):
         with open(filename, 'w') as f:
             f.write("var packets = " + json.dumps(self.generate_packet_list()) + ";")
 
+    def generate_json_text(self):
+        return json.dumps(self.generate_packet_list(), sort_keys=True, indent=4, separators=(',', ': '))
+
     def generate_json_packet_list(self, filename):
         with open(filename, 'w') as f:
-            f.write(json.dumps(self.generate_packet_list(), sort_keys=True, indent=4, separators=(',', ': ')))
+            f.write(self.generate_json_text())
+
+    def generate_python_decoder(self, filename):
+
+        packet_list = self.generate_packet_list()
+
+        txt = """# AUTOGENERATED FILE: DO NOT EDIT MANUALLY
+
+import struct
+
+# sha1 of the packets.json generated alongside this module
+DEFINITIONS_SHA1 = %r
+
+""" % hashlib.sha1(self.generate_json_text().encode('utf-8')).hexdigest()
+
+        for p in packet_list:
+            endian = '<' if p["endian"] == "little" else '>'
+            fmt = endian + ''.join(py_formats[bitfield_types[field["size"]] if field["type"] == "bitfield" else field["type"]]
+                                   for field in p["data"])
+            values = ['v%i' % i for i in range(len(p["data"]))]
+
+            txt += "\n_%s_%s = struct.Struct(%r)\n\n" % (p["board"], p["name"], fmt)
+            txt += "def decode_%s_%s(data, scaled):\n" % (p["board"], p["name"])
+
+            if values:
+                txt += "    %s, = _%s_%s.unpack_from(bytes(data))\n" % (", ".join(values), p["board"], p["name"])
+
+            scaling = ""
+            for v, field in zip(values, p["data"]):
+                expr = v
+                if field["scale"] is not None:
+                    expr = "%s * %r" % (expr, field["scale"])
+                if field["decimals"] is not None:
+                    expr = "round(%s, %r)" % (expr, field["decimals"])
+                if expr != v:
+                    scaling += "        %s = %s\n" % (v, expr)
+            if scaling:
+                txt += "    if scaled:\n" + scaling
+
+            fields = []
+            for v, field in zip(values, p["data"]):
+                if field["type"] == "bitfield":
+                    for bit in field["bits"]:
+                        fields.append("%r: (%s >> %i) & 0x%x" % (field["name"] + "_" + bit["name"], v, bit["shift"],
+                                                                 pow(2, bit["width"]) - 1))
+                else:
+                    fields.append("%r: %s" % (field["name"], v))
+            fields = ", ".join(fields)
+            txt += "    return {'name': %r, 'board': %r, 'data': {%s}}\n\n" % (p["name"], p["board"], fields)
+
+            # the same values as a tuple in SkynetDecode.field_names() order,
+            # straight out of a frame's buffer, for decode_frame()
+            txt += "def values_%s_%s(buffer, offset, scaled):\n" % (p["board"], p["name"])
+            if values:
+                txt += "    %s, = _%s_%s.unpack_from(buffer, offset)\n" % (", ".join(values), p["board"], p["name"])
+            if scaling:
+                txt += "    if scaled:\n" + scaling
+            items = []
+            for v, field in zip(values, p["data"]):
+                if field["type"] == "bitfield":
+                    items.extend("(%s >> %i) & 0x%x" % (v, bit["shift"], pow(2, bit["width"]) - 1)
+                                 for bit in field["bits"])
+                else:
+                    items.append(v)
+            txt += "    return (%s)\n\n" % "".join(i + ", " for i in items).rstrip()
+
+        txt += "\n# decode function per 11-bit address, None where no packet is defined\n"
+        txt += "DECODERS = [None] * 2048\n"
+        for p in packet_list:
+            txt += "DECODERS[0x%x] = decode_%s_%s\n" % (p["address"], p["board"], p["name"])
+
+        txt += "\nVALUES = [None] * 2048\n"
+        for p in packet_list:
+            txt += "VALUES[0x%x] = values_%s_%s\n" % (p["address"], p["board"], p["name"])
+
+        txt += "\nPACKETS = %r\n" % packet_list
+
+        with open(filename, 'w') as f:
+            f.write(txt)
 
 
 if __name__ == "__main__":
@@ -697,3 +916,13 @@ if __name__ == "__main__":
     print("Generating %s ..." % f, end="")
     s.generate_json_packet_list(f)
     print (TermColors.OKGREEN, "[SUCCESS]", TermColors.ENDC)
+
+    f = "%s/static/chunks.json" % os.path.dirname(__file__)
+    print("Generating %s ..." % f, end="")
+    s.generate_json_chunk_list(f)
+    print (TermColors.OKGREEN, "[SUCCESS]", TermColors.ENDC)
+
+    f = "%s/skynet_packets.py" % os.path.dirname(__file__)
+    print("Generating %s ..." % f, end="")
+    s.generate_python_decoder(f)
+    print (TermColors.OKGREEN, "[SUCCESS]", TermColors.ENDC)
@@ -0,0 +1,248 @@
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import multiprocessing
+import struct
+import time
+from multiprocessing.shared_memory import SharedMemory
+from threading import Thread
+
+from skynet_dispatch import SkyNetDispatch
+from skynet_frame import SkyNetFrame
+from skynet_port import SkyNetPort
+
+MAX_FIELDS = 15
+
+# head, rejected frames, resyncs, byte errors, error flag, and how far the
+# writer has started writing (head once the batch is in place)
+HEADER = struct.Struct('<QQQQQQ')
+HEADER_SIZE = 64
+
+# timestamp, address, rtr, length, field count, payload, unpacked field values
+RECORD = struct.Struct('<dHBBB3x16s%id' % MAX_FIELDS)
+
+
+class SkyNetShmRing:
+    # Single-writer ring of fixed-size decoded frame records in shared
+    # memory. Readers keep their own cursor and never block the writer; a
+    # reader that falls more than `capacity` records behind loses the oldest.
+    # The writer announces how far it is about to write before it starts, so
+    # a reader can tell which of the records it copied were being
+    # overwritten at the time, as with a seqlock.
+
+    def __init__(self, shm, capacity):
+        self.shm = shm
+        self.capacity = capacity
+        self.buf = shm.buf
+
+    @staticmethod
+    def size_for(capacity):
+        return HEADER_SIZE + capacity * RECORD.size
+
+    @property
+    def head(self):
+        return struct.unpack_from('<Q', self.buf, 0)[0]
+
+    @property
+    def writing(self):
+        return struct.unpack_from('<Q', self.buf, 40)[0]
+
+    def counters(self):
+        return HEADER.unpack_from(self.buf, 0)[1:5]
+
+    def set_counters(self, rejected, resyncs, byte_errors, error):
+        struct.pack_into('<QQQQ', self.buf, 8, rejected, resyncs, byte_errors, error)
+
+    def publish(self, records):
+        head = self.head
+        pack_into = RECORD.pack_into
+        buf = self.buf
+        padding = (0.0,) * MAX_FIELDS
+
+        struct.pack_into('<Q', buf, 40, head + len(records))
+
+        for t, address, rtr, length, data, values in records:
+            offset = HEADER_SIZE + (head % self.capacity) * RECORD.size
+            pack_into(buf, offset, t, address, rtr, length, len(values), bytes(data),
+                      *(tuple(values) + padding)[:MAX_FIELDS])
+            head += 1
+
+        # records are in place before the head moves past them
+        struct.pack_into('<Q', buf, 0, head)
+
+    def read(self, cursor, max_records):
+        # returns (records, new cursor, records lost to overwrite)
+        head = self.head
+        dropped = 0
+        if head - cursor > self.capacity:
+            dropped = head - self.capacity - cursor
+            cursor = head - self.capacity
+
+        n = min(head - cursor, max_records)
+        if n == 0:
+            return [], cursor, dropped
+
+        i = cursor % self.capacity
+        first = min(n, self.capacity - i)
+        start = HEADER_SIZE + i * RECORD.size
+        raw = bytes(self.buf[start:start + first * RECORD.size])
+        raw += bytes(self.buf[HEADER_SIZE:HEADER_SIZE + (n - first) * RECORD.size])
+
+        # anything the writer lapped, or had started to, while we were
+        # copying is stale
+        lapped = self.writing - self.capacity - cursor
+        skip = max(0, min(lapped, n))
+        records = list(RECORD.iter_unpack(raw))[skip:]
+
+        return records, cursor + n, dropped + skip
+
+
+def _ingest_worker(shm_name, capacity, serial_port, baud, name, definitions_file, sends):
+    from skynet_registry import get_registry
+    from skynet_serial import SkyNetSerial
+
+    shm = SharedMemory(shm_name)
+    ring = SkyNetShmRing(shm, capacity)
+
+    registry = get_registry(definitions_file)
+
+    s = SkyNetSerial(serial_port=serial_port, baud=baud, name=name)
+
+    # frames to transmit, from SkyNetIngest.send in the parent
+    def sender():
+        while True:
+            address, rtr, data = sends.get()
+            s.send(address, rtr, data)
+
+    Thread(target=sender, daemon=True).start()
+
+    def listener(batch):
+        decoder = registry.get()
+        records = []
+        for timestamp, address, rtr, data_length, data_bytes in batch:
+            # raw values only: bitfields stay packed so a packet always fits
+            # in MAX_FIELDS, and the reader expands them. Frames too short
+            # for their packet (e.g. RTRs) carry no values.
+            d = decoder.decoders_by_address.get(address)
+            if d is not None and data_length >= d[2].size:
+                values = decoder.unpack(address, data_bytes)
+            else:
+                values = ()
+            records.append((timestamp, address, rtr, data_length, data_bytes, values))
+        ring.publish(records)
+        ring.set_counters(s.rejected_frames, s.resync_events, s.byte_errors, 0)
+
+    s.add_batch_listener(listener)
+    s.start()
+    s.join()
+
+    ring.set_counters(s.rejected_frames, s.resync_events, s.byte_errors, 1)
+    shm.close()
+
+
+class SkyNetIngest(SkyNetPort, Thread):
+    # Reads and decodes one port in a worker process. This side pulls the
+    # decoded records out of shared memory and hands them to listeners in
+    # this process: raw frames through add_listener/add_batch_listener, as
+    # with SkyNetSerial, and (frame..., values) records through
+    # add_decoded_listener, so consumers don't have to decode again.
+
+    def __init__(self, serial_port='/dev/ttyUSB0', baud=500000, name='',
+                 definitions_file='static/packets.json', capacity=1 << 16):
+
+        super(SkyNetIngest, self).__init__()
+        self.daemon = True
+
+        self.serial_port = serial_port
+        self.baud = baud
+        self.name = name
+        self.definitions_file = definitions_file
+        self.running = False
+        self.error = False
+
+        self.dispatch = SkyNetDispatch()
+        self.decoded = SkyNetDispatch()
+
+        self._shm = SharedMemory(create=True, size=SkyNetShmRing.size_for(capacity))
+        self._shm.buf[:HEADER_SIZE] = bytes(HEADER_SIZE)
+        self.ring = SkyNetShmRing(self._shm, capacity)
+        self.cursor = 0
+        self.dropped = 0
+
+        ctx = multiprocessing.get_context('spawn')
+        self._sends = ctx.Queue()
+        self.process = ctx.Process(target=_ingest_worker, daemon=True,
+                                   args=(self._shm.name, capacity, serial_port, baud, name, definitions_file,
+                                         self._sends))
+
+    def add_decoded_listener(self, listener):
+        # listener(records), records being
+        # (timestamp, address, rtr, length, field_count, payload, *values)
+        self.decoded.add_list_listener(listener)
+
+    def remove_listener(self, listener):
+        super(SkyNetIngest, self).remove_listener(listener)
+        self.decoded.remove_listener(listener)
+
+    def send(self, address, rtr, data):
+        # the worker owns the port, so the frame is handed to it to send
+        if not self.running or len(data) > 15:
+            return False
+
+        self._sends.put((address, not not rtr, list(data)))
+        return True
+
+    # decoding happens in the worker, so the counters come from the ring
+
+    @property
+    def rejected_frames(self):
+        return self.ring.counters()[0]
+
+    @property
+    def resync_events(self):
+        return self.ring.counters()[1]
+
+    @property
+    def byte_errors(self):
+        return self.ring.counters()[2]
+
+    def start(self):
+        self.running = True
+        self.process.start()
+        super(SkyNetIngest, self).start()
+
+    def stop(self):
+        self.running = False
+        self.join()
+        self.process.terminate()
+        self.process.join()
+        self._shm.close()
+        self._shm.unlink()
+
+    def run(self):
+        while self.running:
+            records, self.cursor, dropped = self.ring.read(self.cursor, 8192)
+            self.dropped += dropped
+
+            if not records:
+                if not self.process.is_alive() or self.ring.counters()[3]:
+                    self.error = True
+                    break
+                time.sleep(0.005)
+                continue
+
+            if self.dispatch.subscribers:
+                self.dispatch.publish([SkyNetFrame(r[0], r[1], not not r[2], r[3], r[5], 0) for r in records])
+            if self.decoded.subscribers:
+                self.decoded.publish(records)
+
+        self.running = False
@@ -0,0 +1,87 @@
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+from operator import itemgetter
+
+from influxdb.line_protocol import _escape_tag
+
+
+class SkyNetLineEncoder:
+    # Writes decoded frames from one port straight to influx line protocol.
+    # The series key of a packet never changes for a given port, so each
+    # (address, rtr, origin) gets a bytes template on first use with the
+    # escaped measurement and tags, the field keys in sorted order, and a
+    # conversion per field (ints get the "i" suffix). A point is then one
+    # template % values, appended to the caller's bytearray. The output is
+    # the same as make_lines() for the same points.
+
+    def __init__(self, name):
+        self.name = name
+        self.version = None
+        self.decoder = None
+        self._templates = {}
+
+    def update(self, decoder, version):
+        # templates are rebuilt when the definitions change
+        if version == self.version:
+            return
+
+        self.decoder = decoder
+        self._templates = {}
+        self.version = version
+
+    def _template(self, address, rtr, origin):
+        decoder = self.decoder
+        d = decoder.packets_by_address[address]
+        names = decoder.field_names(address)
+        types = decoder.field_types(address)
+
+        tags = {"board": d["board"], "name": self.name, "rtr": str(rtr), "origin": origin}
+        key = ",".join([_escape_tag(d["name"])] +
+                       ["%s=%s" % (_escape_tag(k), _escape_tag(v)) for k, v in sorted(tags.items())
+                        if _escape_tag(k) != "" and _escape_tag(v) != ""])
+
+        order = sorted(range(len(names)), key=lambda i: names[i])
+
+        if not order:
+            # influx rejects a line without fields (and the whole request
+            # with it), so packets without fields are not written
+            return None
+
+        fields = ",".join("%s=%s" % (_escape_tag(names[i]).replace("%", "%%"), "%r" if types[i] == "float" else "%di")
+                          for i in order)
+        template = (key.replace("%", "%%") + " " + fields + " %d\n").encode('utf-8')
+
+        if len(order) == 1:
+            i = order[0]
+            select = lambda values: (values[i],)
+        else:
+            select = itemgetter(*order)
+
+        return template, select
+
+    def encode(self, out, address, rtr, origin, timestamp, values):
+        # values in the decoder's field_names() order; False if nothing was
+        # written
+        key = (address, rtr, origin)
+        t = self._templates.get(key)
+
+        if t is None:
+            if key in self._templates:
+                return False
+            t = self._templates[key] = self._template(address, rtr, origin)
+            if t is None:
+                return False
+
+        template, select = t
+        out += template % (select(values) + (int(timestamp * 1e9),))
+        return True
@@ -13,11 +13,105 @@
 
 import json
 import struct
+from skynet_frame import SkyNetFrameBatch
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+# struct format character, size and numpy type code for each field type
+field_formats = {
+	"uint8_t": ("B", 1, "u1"),
+	"int8_t": ("b", 1, "i1"),
+	"uint16_t": ("H", 2, "u2"),
+	"int16_t": ("h", 2, "i2"),
+	"uint32_t": ("I", 4, "u4"),
+	"int32_t": ("i", 4, "i4"),
+	"float": ("f", 4, "f4")
+}
+
+# word type carrying a bitfield, by its size in bytes
+bitfield_types = {
+	1: "uint8_t",
+	2: "uint16_t",
+	4: "uint32_t"
+}
+
+def field_format(field):
+	if field["type"] == "bitfield":
+		return field_formats[bitfield_types[field.get("size", 1)]]
+
+	if field["type"] not in field_formats:
+		raise Exception('Unknown data type: %s' % field["type"])
+
+	return field_formats[field["type"]]
+
+def bit_name(field, bit):
+	# each bit of a bitfield is decoded to a field of its own
+	return field["name"] + "_" + bit["name"]
+
+class SkynetDecodedFrame:
+	# Decoded view of a SkyNetFrame. The field values are unpacked straight
+	# out of the frame's buffer the first time they are asked for, and the
+	# field dict is only built if something wants a dict.
+
+	__slots__ = ('frame', 'name', 'board', '_owner', '_decoder', '_values')
+
+	def __init__(self, frame, owner, decoder):
+		self.frame = frame
+		self.name = decoder[0]
+		self.board = decoder[1]
+		self._owner = owner
+		self._decoder = decoder
+		self._values = None
+
+	@property
+	def values(self):
+		# in field_names() order
+		if self._values is None:
+			owner = self._owner
+			if owner.generated_values is not None:
+				self._values = owner.generated_values[self.frame.address](self.frame.buffer, self.frame.start, owner.scaled)
+				return self._values
+			name, board, s, names, scaling, bitfields, fields = self._decoder
+			values = s.unpack_from(self.frame.buffer, self.frame.start)
+			if scaling and owner.scaled:
+				values = owner.apply_scaling(values, scaling)
+			if bitfields:
+				values = owner.expand_bitfields(values, bitfields)
+			self._values = values
+		return self._values
+
+	@property
+	def data(self):
+		return dict(zip(self._decoder[6], self.values))
+
+	def __getitem__(self, field):
+		return self.data[field]
 
 class SkynetDecode:
 
-	def __init__(self, definitions_file):
-		self.packets_by_address = self.load_defs(definitions_file)
+	def __init__(self, definitions_file=None, scaled=False, generated=None):
+		# scaled: apply each field's scale and decimals at decode time, rather
+		# than storing the raw values
+		# generated: a module written by skynet_gen.generate_python_decoder;
+		# its definitions are used instead of the file, and its specialized
+		# functions do the per-frame decode in decode() and decode_frame()
+		# (modules from before VALUES existed only serve decode())
+		self.scaled = scaled
+		self.generated = None
+		self.generated_values = None
+
+		if generated is not None:
+			self.packets_by_address = {d["address"]: d for d in generated.PACKETS}
+			self.generated = generated.DECODERS
+			self.generated_values = getattr(generated, "VALUES", None)
+		else:
+			self.packets_by_address = self.load_defs(definitions_file)
+
+		self.decoders_by_address = self.compile_defs(self.packets_by_address)
+		self.dtypes_by_address = {}
 
 	def load_defs(self, file):
 		defs = json.load(file)
@@ -28,58 +122,240 @@ class SkynetDecode:
 
 		return by_address
 
+	def compile_defs(self, packets_by_address):
+		# one struct covering the whole payload per address, plus the field
+		# names in order, so a frame decodes with a single unpack_from,
+		# (index, scale, decimals) for just the fields that need scaling,
+		# {index: ((name, shift, mask), ...)} for the bitfield words, and the
+		# decoded field names, with each bitfield replaced by its bits
+		decoders = {}
+
+		for address, d in packets_by_address.items():
+
+			if d["endian"] == "little":
+				format = "<"
+			else:
+				format = ">"
+
+			for field in d["data"]:
+				format += field_format(field)[0]
+
+			names = tuple(field["name"] for field in d["data"])
+			scaling = tuple((i, field.get("scale"), field.get("decimals"))
+				for i, field in enumerate(d["data"])
+				if field["type"] != "bitfield"
+				and (field.get("scale") is not None or field.get("decimals") is not None))
+			bitfields = {i: tuple((bit_name(field, bit), bit["shift"], (1 << bit["width"]) - 1) for bit in field["bits"])
+				for i, field in enumerate(d["data"]) if field["type"] == "bitfield"}
+			fields = []
+			for i, name in enumerate(names):
+				if i in bitfields:
+					fields.extend(bit[0] for bit in bitfields[i])
+				else:
+					fields.append(name)
+			decoders[address] = (d["name"], d["board"], struct.Struct(format), names, scaling, bitfields, tuple(fields))
+
+		return decoders
+
 	def decode(self, address, rtr, data_bytes):
 
-		if address not in self.packets_by_address:
+		if self.generated is not None:
+			fn = self.generated[address]
+			return None if fn is None else fn(data_bytes, self.scaled)
+
+		decoder = self.decoders_by_address.get(address)
+
+		if decoder is None:
 			return None
 
-		d = self.packets_by_address[address]
+		name, board, s, names, scaling, bitfields, fields = decoder
 
-		packet = {}
+		values = s.unpack_from(bytes(data_bytes))
 
-		packet["name"] = d["name"]
-		packet["board"] = d["board"]
-		packet["data"] = {}
+		if scaling and self.scaled:
+			values = self.apply_scaling(values, scaling)
 
-		byte = 0
+		if bitfields:
+			values = self.expand_bitfields(values, bitfields)
 
-		if d["endian"] == "little":
-			endian = "<"
-		else:
-			endian = ">"
-
-		for field in d["data"]:
-
-			if field["type"] == "uint8_t":
-				format = "B"
-				length = 1
-			elif field["type"] == "int8_t":
-				format = "b"
-				length = 1
-			elif field["type"] == "uint16_t":
-				format = endian + "H"
-				length = 2
-			elif field["type"] == "int16_t":
-				format = endian + "h"
-				length = 2
-			elif field["type"] == "uint32_t":
-				format =  endian + "I"
-				length = 4
-			elif field["type"] == "int32_t":
-				format = endian + "i"
-				length = 4
-			elif field["type"] == "float":
-				format = endian + "f"
-				length = 4
-
-			bytes = bytearray(data_bytes[byte:byte+length])
-			data = struct.unpack(format, bytes)[0]
-			packet["data"][field["name"]] = data
-			byte += length
-			# TODO: implement scale
+		packet = {}
+
+		packet["name"] = name
+		packet["board"] = board
+		packet["data"] = dict(zip(fields, values))
 
 		return packet
 
+	def decode_frame(self, frame):
+		# lazy decode of a SkyNetFrame; None for an unknown address or a frame
+		# too short for its packet
+		decoder = self.decoders_by_address.get(frame.address)
+
+		if decoder is None or frame.length < decoder[2].size:
+			return None
+
+		return SkynetDecodedFrame(frame, self, decoder)
+
+	def unpack(self, address, data_bytes):
+		# the raw value of every field in the payload, bitfields still packed
+		# into their words; None for an unknown address
+		decoder = self.decoders_by_address.get(address)
+
+		if decoder is None:
+			return None
+
+		return decoder[2].unpack_from(bytes(data_bytes))
+
+	def expand_bitfields(self, values, bitfields):
+		expanded = []
+
+		for i, v in enumerate(values):
+			if i in bitfields:
+				expanded.extend((v >> shift) & mask for bit, shift, mask in bitfields[i])
+			else:
+				expanded.append(v)
+
+		return expanded
+
+	def apply_scaling(self, values, scaling):
+		values = list(values)
+
+		for i, scale, decimals in scaling:
+			v = values[i]
+			if scale is not None:
+				v = v * scale
+			if decimals is not None:
+				v = round(v, decimals)
+			values[i] = v
+
+		return values
+
+	def field_names(self, address):
+		# decoded field names, in the order of every values sequence here
+		return self.decoders_by_address[address][6]
+
+	def field_types(self, address):
+		# "float" or "int" per decoded field: what the values will be once
+		# any scaling has been applied
+		types = []
+
+		for field in self.packets_by_address[address]["data"]:
+			if field["type"] == "bitfield":
+				types.extend("int" for bit in field["bits"])
+			elif field["type"] == "float" or (self.scaled and (field.get("scale") is not None
+					or field.get("decimals") is not None)):
+				types.append("float")
+			else:
+				types.append("int")
+
+		return tuple(types)
+
+	def field_values(self, address, values):
+		# raw values unpacked elsewhere (e.g. by an ingest worker), scaled and
+		# with bitfields expanded like decode()
+		name, board, s, names, scaling, bitfields, fields = self.decoders_by_address[address]
+
+		if scaling and self.scaled:
+			values = self.apply_scaling(values, scaling)
+
+		if bitfields:
+			values = self.expand_bitfields(values, bitfields)
+
+		return values
+
+	def decode_values(self, address, values):
+		return dict(zip(self.field_names(address), self.field_values(address, values)))
+
+	def packet_dtype(self, address):
+		# numpy structured dtype laid out exactly like the packet's payload
+		d = self.packets_by_address[address]
+		endian = "<" if d["endian"] == "little" else ">"
+
+		return numpy.dtype([(field["name"], endian + field_format(field)[2]) for field in d["data"]])
+
+	def decode_batch(self, batch):
+		# Decodes a SkyNetFrameBatch (or a list of frames) into columns:
+		#   {address: {"name", "board", "timestamp", "rtr", "data": {field: array}}}
+		# Frames are grouped by address with numpy, and each group's payloads
+		# are gathered into one array and viewed through the packet dtype, so
+		# there is no Python work per frame. Every bit of a bitfield word is
+		# extracted in one broadcast shift-and-mask over the whole column.
+		# Unknown addresses and frames too short for their packet are skipped.
+
+		if numpy is None:
+			raise ImportError("decode_batch requires numpy, which couldn't be imported")
+
+		if not isinstance(batch, SkyNetFrameBatch):
+			batch = SkyNetFrameBatch.from_frames(batch)
+
+		decoded = {}
+
+		if len(batch) == 0:
+			return decoded
+
+		addresses = numpy.frombuffer(batch.addresses, dtype=numpy.uint16)
+		timestamps = numpy.frombuffer(batch.timestamps, dtype=numpy.float64)
+		rtrs = numpy.frombuffer(batch.rtrs, dtype=numpy.uint8)
+		lengths = numpy.frombuffer(batch.lengths, dtype=numpy.uint8)
+		offsets = numpy.frombuffer(batch.offsets, dtype=numpy.uint32)
+		payload = numpy.frombuffer(batch.payload, dtype=numpy.uint8)
+
+		for address in numpy.unique(addresses).tolist():
+
+			if address not in self.packets_by_address:
+				continue
+
+			d = self.packets_by_address[address]
+
+			if address not in self.dtypes_by_address:
+				self.dtypes_by_address[address] = self.packet_dtype(address)
+			dtype = self.dtypes_by_address[address]
+
+			index = numpy.nonzero((addresses == address) & (lengths >= dtype.itemsize))[0]
+
+			if dtype.itemsize:
+				rows = payload[offsets[index][:, None] + numpy.arange(dtype.itemsize)]
+				records = rows.view(dtype).reshape(-1)
+				data = {name: records[name] for name in dtype.names}
+			else:
+				data = {}
+
+			if self.scaled:
+				for i, scale, decimals in self.decoders_by_address[address][4]:
+					name = dtype.names[i]
+					column = data[name].astype(numpy.float64)
+					if scale is not None:
+						column = column * scale
+					if decimals is not None:
+						column = numpy.round(column, decimals)
+					data[name] = column
+
+			bitfields = self.decoders_by_address[address][5]
+			if bitfields:
+				columns = {}
+				for i, name in enumerate(dtype.names):
+					if i not in bitfields:
+						columns[name] = data[name]
+						continue
+					bits = bitfields[i]
+					word = data[name].astype(dtype[i].newbyteorder("="))
+					shifts = numpy.array([shift for bit, shift, mask in bits], dtype=word.dtype)
+					masks = numpy.array([mask for bit, shift, mask in bits], dtype=word.dtype)
+					extracted = (word[:, None] >> shifts) & masks
+					for j, (bit, shift, mask) in enumerate(bits):
+						columns[bit] = extracted[:, j]
+				data = columns
+
+			decoded[address] = {
+				"name": d["name"],
+				"board": d["board"],
+				"timestamp": timestamps[index],
+				"rtr": rtrs[index].astype(bool),
+				"data": data
+			}
+
+		return decoded
+
 	def print_defs(self):
 		print(self.packets_by_address)
 
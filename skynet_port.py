@@ -0,0 +1,48 @@
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+from skynet_frame import SkynetFrameDecoder
+
+
+def serial_decoder(baud):
+    # frames are stamped from their byte offset in a read, at 10 bits on the
+    # wire per byte at 8N1
+    return SkynetFrameDecoder(byte_time=10.0 / baud)
+
+
+class SkyNetPort:
+    # The listener interface and receive counters every frame source has in
+    # common (SkyNetSerial, SkyNetAsyncSerial, SkyNetIngest, SkyNetReplay),
+    # so loggers attach to any of them the same way. Sources set `dispatch`
+    # to their SkyNetDispatch and `decoder` to the SkynetFrameDecoder their
+    # bytes go through.
+
+    def add_listener(self, listener):
+        self.dispatch.add_listener(listener)
+
+    def add_batch_listener(self, listener):
+        self.dispatch.add_batch_listener(listener)
+
+    def remove_listener(self, listener):
+        self.dispatch.remove_listener(listener)
+
+    @property
+    def rejected_frames(self):
+        return self.decoder.crc_errors
+
+    @property
+    def resync_events(self):
+        return self.decoder.resyncs
+
+    @property
+    def byte_errors(self):
+        return self.decoder.byte_errors
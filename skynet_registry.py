@@ -0,0 +1,130 @@
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import copy
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import time
+from threading import Thread, Lock
+
+from skynet_parse import SkynetDecode
+
+
+class SkynetRegistry(Thread):
+    # Compiled packet definitions shared by everything in the process. A
+    # background thread watches the definitions file and the generated
+    # module, and recompiles when either one's mtime changes; the new
+    # decoders replace the old ones in a single assignment, so readers never
+    # see a half-built set and never reparse.
+
+    def __init__(self, path='static/packets.json', interval=1.0, module_path='skynet_packets.py'):
+        super(SkynetRegistry, self).__init__()
+        self.daemon = True
+
+        self.path = path
+        self.module_path = module_path
+        self.interval = interval
+        self.error = None
+        self._mtime = None
+
+        # (version, raw decoder, scaled decoder, packets.js text)
+        self._current = (0, None, None, None)
+
+        self.load()
+
+    @property
+    def version(self):
+        return self._current[0]
+
+    def get(self, scaled=False):
+        current = self._current
+        return current[2] if scaled else current[1]
+
+    def packets_js(self):
+        return self._current[3]
+
+    def mtimes(self):
+        # the module may not have been generated (yet)
+        try:
+            module_mtime = os.stat(self.module_path).st_mtime
+        except OSError:
+            module_mtime = None
+
+        return os.stat(self.path).st_mtime, module_mtime
+
+    def load(self):
+        mtime = self.mtimes()
+
+        with open(self.path) as f:
+            text = f.read()
+
+        # use the generated decoder module if it was built from this exact
+        # definitions file; otherwise fall back to parsing the JSON
+        generated = self.load_generated(hashlib.sha1(text.encode('utf-8')).hexdigest())
+
+        if generated is not None:
+            raw = SkynetDecode(generated=generated)
+        else:
+            raw = SkynetDecode(io.StringIO(text))
+        scaled = copy.copy(raw)
+        scaled.scaled = True
+
+        js = "var packets = " + json.dumps(list(raw.packets_by_address.values())) + ";"
+
+        self._current = (self._current[0] + 1, raw, scaled, js)
+        self._mtime = mtime
+        self.error = None
+
+    def load_generated(self, sha1):
+        if not os.path.exists(self.module_path):
+            return None
+
+        spec = importlib.util.spec_from_file_location("skynet_packets", self.module_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+        if getattr(module, "DEFINITIONS_SHA1", None) != sha1:
+            return None
+
+        return module
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+
+            try:
+                if self.mtimes() != self._mtime:
+                    # give the generator a moment to finish the other file too
+                    time.sleep(self.interval)
+                    self.load()
+                    print("Reloaded %s (version %i)" % (self.path, self.version))
+            except Exception as e:
+                # e.g. the generator is halfway through writing the file;
+                # keep the old definitions and try again next time
+                self.error = str(e)
+
+
+_registries = {}
+_registries_lock = Lock()
+
+
+def get_registry(path='static/packets.json'):
+    # one watched registry per definitions file per process
+    with _registries_lock:
+        if path not in _registries:
+            r = SkynetRegistry(path)
+            r.start()
+            _registries[path] = r
+        return _registries[path]
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import argparse
+import time
+from threading import Thread
+
+from skynet_dispatch import SkyNetDispatch
+from skynet_frame import SkynetFrameDecoder, read_capture
+from skynet_port import SkyNetPort
+
+
+class SkyNetReplay(SkyNetPort, Thread):
+    # Plays a raw serial capture through the same listener interface as
+    # SkyNetSerial, so the loggers can be attached to it unchanged.
+
+    def __init__(self, capture_file, name='', chunk_size=1 << 16):
+
+        super(SkyNetReplay, self).__init__()
+
+        self.capture_file = capture_file
+        self.chunk_size = chunk_size
+        self.running = False
+        self.error = False
+        self.name = name
+        self.frame_count = 0
+
+        self.dispatch = SkyNetDispatch()
+        self.decoder = SkynetFrameDecoder()
+
+    def stop(self):
+        self.running = False
+        self.join()
+
+    def run(self):
+        self.running = True
+
+        try:
+            with open(self.capture_file, 'rb') as f:
+                for frames in read_capture(f, self.chunk_size, self.decoder):
+                    if not self.running:
+                        break
+                    self.frame_count += len(frames)
+                    self.dispatch.publish(frames)
+
+                    # a file can be read faster than listeners keep up, so
+                    # hold off rather than letting the ring overwrite frames
+                    while self.running and self.dispatch.lag() > self.dispatch.ring.size // 2:
+                        time.sleep(0.01)
+        except Exception:
+            self.error = True
+
+        self.running = False
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("capture")
+    p.add_argument("--name", default="replay")
+    p.add_argument("--influx", action="store_true", help="write the decoded frames to influx")
+    args = p.parse_args()
+
+    r = SkyNetReplay(args.capture, name=args.name)
+
+    if args.influx:
+        from influx_connection import SkynetInflux
+        from logger_influx import SkyNetDBLogger
+
+        logger = SkyNetDBLogger(args.name, r, SkynetInflux())
+        logger.daemon = True
+        logger.start()
+
+    start = time.time()
+    r.start()
+    r.join()
+    elapsed = time.time() - start
+
+    if args.influx:
+        # once the listener has taken the last frame, stop() sends
+        # whatever the logger still has pending or in flight
+        while r.dispatch.lag() > 0:
+            time.sleep(0.1)
+        r.remove_listener(logger.listener)
+        logger.stop()
+
+    print("%i frames in %.2f s" % (r.frame_count, elapsed))
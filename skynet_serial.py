@@ -14,9 +14,12 @@
 
 import os
 import serial
-import struct
 import time
-from threading import Thread
+from collections import deque
+from threading import Thread, Condition
+from skynet_dispatch import SkyNetDispatch
+from skynet_frame import SkyNetClock, encode_frame_cached
+from skynet_port import SkyNetPort, serial_decoder
 
 
 def get_serial_ports():
@@ -27,13 +30,94 @@ def get_serial_ports():
     return ports
 
 
-class SkyNetSerial(Thread):
+class SkyNetSendQueue(Thread):
+    # Sends queued frames for a SkyNetSerial from its own thread, so request
+    # threads never block on the port. Whatever has queued up by the time a
+    # write finishes goes out together in the next write().
+
+    def __init__(self, serial_connection):
+        super(SkyNetSendQueue, self).__init__()
+        self.daemon = True
+
+        self.s = serial_connection
+        self.running = False
+        self._queue = []
+        self._cond = Condition()
+
+        self.frames = 0
+        self.writes = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def put(self, frame):
+        with self._cond:
+            self._queue.append((frame, time.monotonic()))
+            if len(self._queue) > self.max_depth:
+                self.max_depth = len(self._queue)
+            self._cond.notify()
+
+    def stats(self):
+        return {
+            "queue_depth": len(self._queue),
+            "max_queue_depth": self.max_depth,
+            "frames": self.frames,
+            "writes": self.writes,
+            "errors": self.errors,
+            "mean_latency": self.latency_total / self.frames if self.frames else 0.0,
+            "max_latency": self.latency_max
+        }
+
+    def start(self):
+        self.running = True
+        super(SkyNetSendQueue, self).start()
+
+    def stop(self):
+        self.running = False
+        with self._cond:
+            self._cond.notify()
+
+    def run(self):
+        while self.running:
+            with self._cond:
+                if not self._queue:
+                    self._cond.wait(0.5)
+                pending, self._queue = self._queue, []
+
+            if not pending:
+                continue
+
+            try:
+                self.s._port_handle.write(b''.join(f for f, t in pending))
+            except Exception:
+                # port is down; SkyNetSerial.run is already reconnecting
+                self.errors += len(pending)
+                continue
+
+            now = time.monotonic()
+            for f, t in pending:
+                latency = now - t
+                self.latency_total += latency
+                if latency > self.latency_max:
+                    self.latency_max = latency
+            self.frames += len(pending)
+            self.writes += 1
+
+
+class SkyNetSerial(SkyNetPort, Thread):
 
     ESCAPE_CHARACTER = b'\x7D'
     START_CHARACTER = b'\x7E'
     ESCAPE_VALUE = 0x7D
     START_VALUE = 0x7E
 
+    READ_SIZE = 65536
+
+    # reopen delays after the port drops, doubling up to the max
+    RECONNECT_MIN = 0.05
+    RECONNECT_MAX = 5.0
+
     def __init__(self, serial_port='/dev/ttyUSB0', baud=500000, name=''):
 
         super(SkyNetSerial, self).__init__()
@@ -46,10 +130,19 @@ class SkyNetSerial(Thread):
         self.error = False
         self.name = name
 
-        self.listeners = []
+        self.dispatch = SkyNetDispatch()
+        self.decoder = serial_decoder(baud)
+        self.clock = SkyNetClock()
+
+        # (lost, restored) wall times of the most recent outages
+        self.gaps = deque(maxlen=100)
+        self.reconnects = 0
+
+        self.send_queue = SkyNetSendQueue(self)
 
     def stop(self):
         self.running = False
+        self.send_queue.stop()
         self.join()
 
     def get(self):
@@ -63,86 +156,60 @@ class SkyNetSerial(Thread):
         if len(data) > 15:
             return False
 
-        to_send = self.START_CHARACTER
-
-        if rtr:
-            rtr = 1
-        else:
-            rtr = 0
+        self.send_queue.put(encode_frame_cached(address, not not rtr, tuple(data)))
+        return True
 
-        # add the metadata
-        unescaped_data = [address//8, (address % 8)*32+rtr*16+len(data)] + data
-
-        # add the CRC
-        unescaped_data.append(sum(unescaped_data) % 256)
-
-        for d in unescaped_data:
-            if d == self.ESCAPE_VALUE or d == self.START_VALUE:
-                to_send += self.ESCAPE_CHARACTER
-                d ^= 0x20
-            to_send += struct.pack('>B', d)
-
-        print(to_send)
-        self._port_handle.write(to_send)
+    def send_stats(self):
+        stats = self.send_queue.stats()
+        stats["encode_cache_hits"] = encode_frame_cached.cache_info().hits
+        return stats
 
     def run(self):
-        self._port_handle = serial.Serial(self.serial_port, self.baud)
-
         self.running = True
-        escaped = False
-        data_bytes = []
-        meta_bytes = []
-        crc_bytes = []
-        data_length = 0
-        address = 0
-        rtr = False
-        timestamp = 0
-
-        # wait for the next start-of-frame
-        c = self._port_handle.read()
-        while c != self.START_CHARACTER:
-            c = self._port_handle.read()
+        self.send_queue.start()
+        backoff = self.RECONNECT_MIN
+        lost_at = None
 
         while self.running:
             try:
-                c = self._port_handle.read()
-
-                if c == self.START_CHARACTER:
-                    timestamp = time.time()
-                    data_bytes = []
-                    meta_bytes = []
-                    crc_bytes = []
-                    continue
-
-                if c == self.ESCAPE_CHARACTER:
-                    escaped = True
-                    continue
-
-                c = ord(c)
-
-                if escaped:
-                    c ^= 0x20
-                    escaped = False
-                
-                if len(meta_bytes) == 0:
-                    meta_bytes.append(c)
-                elif len(meta_bytes) == 1:
-                    meta_bytes.append(c)
-                    address = (meta_bytes[1] // 32 + meta_bytes[0] * 8) 
-                    rtr = not not(meta_bytes[1] & 16)
-                    data_length = meta_bytes[1] & 15
-                elif len(data_bytes) < data_length:
-                    data_bytes.append(c)
-                elif len(crc_bytes) == 0:
-                    crc_bytes.append(c)
-                    # TODO: verify CRC when implemented
-                    for l in self.listeners:
-                        l(timestamp, address, rtr, data_length, data_bytes)
-                else:
-                    pass
-            except Exception as e:
+                self._port_handle = serial.Serial(self.serial_port, self.baud)
+            except Exception:
+                # the device is gone (e.g. USB re-enumeration); keep trying
                 self.error = True
-                break
+                if lost_at is None:
+                    lost_at = time.time()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.RECONNECT_MAX)
+                continue
+
+            if lost_at is not None:
+                self.gaps.append((lost_at, time.time()))
+                self.reconnects += 1
+                lost_at = None
+
+            self.error = False
+            backoff = self.RECONNECT_MIN
+
+            # a partial frame from before the drop is useless; wait for the
+            # next start-of-frame
+            self.decoder.reset()
+            self.clock.anchor()
+
+            while self.running:
+                try:
+                    # block for at least one byte, then take everything that is waiting
+                    n = min(max(1, self._port_handle.in_waiting), self.READ_SIZE)
+                    chunk = self._port_handle.read(n)
+                except Exception:
+                    self.error = True
+                    lost_at = time.time()
+                    break
+
+                self.dispatch.publish(self.decoder.feed(chunk, self.clock.now()))
 
-        self.running = False
+            try:
+                self._port_handle.close()
+            except Exception:
+                pass
 
+        self.running = False
@@ -0,0 +1,167 @@
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import os
+import struct
+import zlib
+
+# body length, point count, crc32 of the body
+RECORD_HEADER = struct.Struct('<III')
+
+
+class SkyNetSpool:
+    # Append-only store of encoded write bodies that could not be sent. It
+    # is a directory of numbered segment files, each a run of records
+    # (header + body). Records are read back oldest first. A segment is
+    # deleted once everything in it has been replayed. When the spool grows
+    # past max_bytes, the oldest segments are dropped, so it stays within
+    # max_bytes plus the segment being written. Segments left over
+    # from a previous run are picked up again on start; a record torn by a
+    # crash fails its crc and ends that segment.
+    #
+    # Not thread safe: the logger's writer thread is the only user.
+
+    def __init__(self, directory, segment_bytes=8 << 20, max_bytes=1 << 30):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self.segments = sorted(int(f[:-6]) for f in os.listdir(directory) if f.endswith('.spool'))
+        self.bytes = sum(os.path.getsize(self._path(s)) for s in self.segments)
+
+        self._writer = None
+        self._reader = None
+        self._reader_segment = None
+        self._next = None
+
+        self.spooled = 0
+        self.replayed = 0
+        self.dropped = 0
+
+    def _path(self, segment):
+        return os.path.join(self.directory, "%012i.spool" % segment)
+
+    def __len__(self):
+        return len(self.segments)
+
+    def stats(self):
+        return {
+            "segments": len(self.segments),
+            "bytes": self.bytes,
+            "spooled": self.spooled,
+            "replayed": self.replayed,
+            "dropped": self.dropped
+        }
+
+    def append(self, count, body):
+        if self._writer is None or self._writer.tell() >= self.segment_bytes:
+            self._rotate()
+
+        self._writer.write(RECORD_HEADER.pack(len(body), count, zlib.crc32(body)))
+        self._writer.write(body)
+        self._writer.flush()
+        os.fsync(self._writer.fileno())
+
+        self.bytes += RECORD_HEADER.size + len(body)
+        self.spooled += count
+
+        while self.bytes > self.max_bytes and len(self.segments) > 1:
+            self._drop_oldest()
+
+    def _rotate(self):
+        if self._writer is not None:
+            self._writer.close()
+
+        segment = self.segments[-1] + 1 if self.segments else 0
+        self.segments.append(segment)
+        self._writer = open(self._path(segment), 'ab')
+
+    def _drop_oldest(self):
+        segment = self.segments[0]
+
+        if segment == self._reader_segment:
+            self._close_reader()
+            self._next = None
+
+        # count what is lost, then the file goes
+        with open(self._path(segment), 'rb') as f:
+            for count, body in self._records(f):
+                self.dropped += count
+
+        self._remove(segment)
+
+    def _remove(self, segment):
+        if self._writer is not None and segment == self.segments[-1]:
+            self._writer.close()
+            self._writer = None
+
+        self.bytes -= os.path.getsize(self._path(segment))
+        os.unlink(self._path(segment))
+        self.segments.remove(segment)
+
+    def _records(self, f):
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            length, count, crc = RECORD_HEADER.unpack(header)
+            body = f.read(length)
+            if len(body) < length or zlib.crc32(body) != crc:
+                return
+            yield count, body
+
+    def _close_reader(self):
+        if self._reader is not None:
+            self._reader.close()
+        self._reader = None
+        self._reader_segment = None
+
+    def peek(self):
+        # oldest (count, body) not yet replayed, or None if the spool is empty
+        while self._next is None:
+            if not self.segments:
+                return None
+
+            if self._reader is None:
+                self._reader_segment = self.segments[0]
+                self._reader = open(self._path(self._reader_segment), 'rb')
+
+            record = next(self._records(self._reader), None)
+
+            if record is not None:
+                self._next = record
+            elif self._writer is not None and self._reader_segment == self.segments[-1]:
+                # caught up with the segment being written
+                if self._writer.tell() > self._reader.tell():
+                    return None
+                self._close_reader()
+                self._remove(self.segments[-1])
+            else:
+                self._close_reader()
+                self._remove(self.segments[0])
+
+        return self._next
+
+    def commit(self):
+        # the record from peek() has been written
+        self.replayed += self._next[0]
+        self._next = None
+        # read ahead, so a segment is gone as soon as its last record is
+        # done and isn't replayed again after a restart
+        self.peek()
+
+    def skip(self):
+        # the record from peek() will never be accepted
+        self.dropped += self._next[0]
+        self._next = None
+        self.peek()
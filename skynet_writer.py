@@ -0,0 +1,133 @@
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import time
+from collections import deque
+from threading import Thread, Condition
+from logger_influx import SkyNetHistogram
+
+
+class SkyNetWriterPool:
+    # Threads that send line protocol bodies to influx, each with its own
+    # client, so its own requests.Session and keep-alive connection. Every
+    # body is submitted with a key and writes with the same key go out one
+    # at a time, in the order they were submitted; writes with different
+    # keys go out in parallel. Loggers key their writes by port and shard,
+    # with every point of a series in the same shard.
+
+    def __init__(self, make_client, workers=4):
+        # make_client: returns a new InfluxDBClient for each worker
+        self.make_client = make_client
+        self.workers = workers
+        self.running = True
+
+        # key -> deque of (body, done) not sent yet; `ready` has the keys
+        # with something queued and nothing in flight
+        self._queues = {}
+        self._ready = deque()
+        self._busy = set()
+        self._lock = Condition()
+
+        self.queued = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.writes = 0
+        self.errors = 0
+        self.latency = SkyNetHistogram([0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0])
+        self.concurrency = SkyNetHistogram(list(range(1, workers + 1)))
+
+        self._threads = [Thread(target=self.run, daemon=True) for i in range(workers)]
+        for t in self._threads:
+            t.start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queued": self.queued,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "writes": self.writes,
+                "errors": self.errors,
+                "latency": self.latency.stats(),
+                "in_flight_at_send": self.concurrency.stats()
+            }
+
+    def submit(self, key, body, done):
+        # done(error) is called from a worker once the write is over, with
+        # None or the exception the client raised
+        with self._lock:
+            queue = self._queues.get(key)
+
+            if queue is None:
+                queue = self._queues[key] = deque()
+                if key not in self._busy:
+                    self._ready.append(key)
+                    self._lock.notify()
+
+            queue.append((body, done))
+            self.queued += 1
+
+    def stop(self):
+        with self._lock:
+            self.running = False
+            self._lock.notify_all()
+
+        for t in self._threads:
+            t.join()
+
+    def run(self):
+        client = self.make_client()
+
+        while True:
+            with self._lock:
+                while self.running and not self._ready:
+                    self._lock.wait()
+
+                if not self._ready:
+                    return
+
+                key = self._ready.popleft()
+                queue = self._queues[key]
+                body, done = queue.popleft()
+                if not queue:
+                    del self._queues[key]
+                self._busy.add(key)
+
+                self.queued -= 1
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                self.concurrency.add(self.in_flight)
+
+            start = time.monotonic()
+            error = None
+
+            try:
+                client.write(body, params={'db': client._database}, protocol='line')
+            except Exception as e:
+                error = e
+
+            # before the key is released, so completions come in order too
+            done(error)
+
+            with self._lock:
+                self.in_flight -= 1
+                self.latency.add(time.monotonic() - start)
+                if error is None:
+                    self.writes += 1
+                else:
+                    self.errors += 1
+
+                self._busy.discard(key)
+                if key in self._queues:
+                    self._ready.append(key)
+                    self._lock.notify()
@@ -126,6 +126,11 @@ function decodePacket(packet) {
                 field_data = dv.getFloat32(byte, littleEndian);
                 byte += 4;
                 break;
+            case "bitfield":
+                field_data = readWord(dv, byte, format.data[field_num].size, littleEndian);
+                byte += format.data[field_num].size;
+                decodeBits(packet, format.data[field_num], field_data);
+                continue;
         }
 
 		var fmtdata = format.data[field_num]
@@ -159,6 +164,58 @@ function decodePacket(packet) {
     return true;
 }
 
+function readWord(dv, byte, size, littleEndian)
+{
+    switch (size)
+    {
+        case 1: return dv.getUint8(byte);
+        case 2: return dv.getUint16(byte, littleEndian);
+        case 4: return dv.getUint32(byte, littleEndian);
+    }
+}
+
+function writeWord(dv, byte, size, value, littleEndian)
+{
+    switch (size)
+    {
+        case 1: dv.setUint8(byte, value); break;
+        case 2: dv.setUint16(byte, value, littleEndian); break;
+        case 4: dv.setUint32(byte, value, littleEndian); break;
+    }
+}
+
+// each bit of a bitfield shows up as a field of its own, named field_bit
+function decodeBits(packet, fmtdata, word)
+{
+    for (var b in fmtdata.bits)
+    {
+        var bit = fmtdata.bits[b];
+        var value = Math.floor(word / Math.pow(2, bit.shift)) % Math.pow(2, bit.width);
+
+        packet.decoded[fmtdata.name + "_" + bit.name] = {
+            'value': value,
+            'cvalue': value,
+            'unit': "",
+            'decimals': null
+        };
+    }
+}
+
+function encodeBits(packet, fmtdata)
+{
+    var word = 0;
+
+    for (var b in fmtdata.bits)
+    {
+        var bit = fmtdata.bits[b];
+        var value = parseInt(packet.decoded[fmtdata.name + "_" + bit.name]) || 0;
+
+        word += (value % Math.pow(2, bit.width)) * Math.pow(2, bit.shift);
+    }
+
+    return word;
+}
+
 function encodePacket(packet)
 {
     if (!(packet.address in packetsByAddress)) return;
@@ -205,6 +262,10 @@ function encodePacket(packet)
                 dv.setFloat32(byte, parseFloat(packet.decoded[format.data[field_num].name]), littleEndian);
                 byte += 4;
             break;
+            case "bitfield":
+                writeWord(dv, byte, format.data[field_num].size, encodeBits(packet, format.data[field_num]), littleEndian);
+                byte += format.data[field_num].size;
+            break;
         }
     }
 
@@ -0,0 +1,66 @@
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import json
+import os
+import sys
+import time
+
+import pytest
+
+# the skynet modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import StubConnection, StubInflux, bench_definitions, packet_frames
+from skynet_frame import SkyNetFrameBatch
+
+
+@pytest.fixture
+def stub():
+    s = StubInflux()
+    yield s
+    if not s.down:
+        s.close()
+
+
+@pytest.fixture
+def definitions(tmp_path):
+    path = tmp_path / "packets.json"
+    path.write_text(json.dumps(bench_definitions()))
+    return str(path)
+
+
+@pytest.fixture
+def batches(definitions):
+    # batches(count, size) -> SkyNetFrameBatch list of the bench packet mix,
+    # every frame with its own timestamp
+    def make(count, size=100):
+        with open(definitions) as f:
+            frames = packet_frames(json.load(f), count * size)
+        return [SkyNetFrameBatch.from_frames([(i + j, a, r, len(d), d)
+                                              for j, (a, r, d) in enumerate(frames[i:i + size])])
+                for i in range(0, len(frames), size)]
+    return make
+
+
+@pytest.fixture
+def connection():
+    return StubConnection()
+
+
+def wait_for(condition, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.01)
+    return True
@@ -0,0 +1,166 @@
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# Stand-ins for influx and a serial port, and a packet mix to feed them,
+# shared by the tests and skynet_bench.py.
+
+import gzip
+import random
+import time
+from threading import Thread
+
+
+def bench_definitions():
+    # a packet mix in the packets.json format, roughly like a real car
+    types = [('uint8_t', 1), ('int8_t', 1), ('uint16_t', 2), ('int16_t', 2),
+             ('uint32_t', 4), ('int32_t', 4), ('float', 4)]
+    r = random.Random(1)
+    defs = []
+    for i in range(64):
+        data = []
+        length = 0
+        while True:
+            t, size = r.choice(types)
+            if length + size > 8:
+                break
+            data.append({"name": "field%i" % len(data), "type": t, "description": None,
+                         "unit": None, "scale": None, "decimals": None})
+            length += size
+        defs.append({"name": "packet%i" % i, "board": "board%i" % (i // 8), "description": None,
+                     "endian": r.choice(["little", "big"]), "address": 0x100 + i, "data": data})
+    return defs
+
+
+def packet_frames(defs, count, seed=0):
+    sizes = {'uint8_t': 1, 'int8_t': 1, 'uint16_t': 2, 'int16_t': 2,
+             'uint32_t': 4, 'int32_t': 4, 'float': 4}
+    r = random.Random(seed)
+    frames = []
+    for i in range(count):
+        d = r.choice(defs)
+        length = sum(sizes[f["type"]] for f in d["data"])
+        frames.append((d["address"], False, [r.randrange(256) for _ in range(length)]))
+    return frames
+
+
+class StubInflux:
+    # Just enough of the influx HTTP API on localhost for the logger tests
+    # and benchmarks: /write counts what it gets and answers 204, /query answers
+    # with `result`. Bodies are gzipped both ways when the client asks.
+    # `bandwidth` (bytes/s) stands in for a slow link by holding each body
+    # for as long as it would take to send. A write takes `delay` plus
+    # `line_cost` per line, on one of `cores` (None for no limit). stop()
+    # stops it listening and hangs up on open connections until up().
+
+    def __init__(self, delay=0.0, bandwidth=None, line_cost=0.0, cores=None):
+        from http.server import BaseHTTPRequestHandler
+        from threading import BoundedSemaphore
+
+        stub = self
+        self.delay = delay
+        self.bandwidth = bandwidth
+        self.line_cost = line_cost
+        self.cores = BoundedSemaphore(cores) if cores else None
+        self.down = False
+        self.result = b'{"results": [{}]}'
+        self.compressed = (None, None)
+        self.writes = 0
+        self.lines = 0
+        self.bytes = 0
+        self.queries = 0
+        self.sent = 0
+
+        def transfer(size):
+            if stub.bandwidth:
+                time.sleep(size / stub.bandwidth)
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if stub.down:
+                    self.close_connection = True
+                    return
+                transfer(len(body))
+                size = len(body)
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                lines = body.count(b"\n")
+                if stub.cores is not None:
+                    with stub.cores:
+                        time.sleep(stub.delay + lines * stub.line_cost)
+                else:
+                    time.sleep(stub.delay + lines * stub.line_cost)
+                stub.writes += 1
+                stub.bytes += size
+                stub.lines += lines
+                self.send_response(204)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self):
+                body = stub.result
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    if stub.compressed[0] is not body:
+                        stub.compressed = (body, gzip.compress(body, 1))
+                    body = stub.compressed[1]
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                transfer(len(body))
+                stub.queries += 1
+                stub.sent += len(body)
+                self.wfile.write(body)
+
+        self.handler = Handler
+        self.port = 0
+        self.up()
+
+    def up(self):
+        from http.server import ThreadingHTTPServer
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port), self.handler)
+        self.port = self.server.server_address[1]
+        self.down = False
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.down = True
+        self.close()
+
+    def client(self, gzip=False):
+        from influxdb import InfluxDBClient
+        return InfluxDBClient("127.0.0.1", self.port, "root", "root", "skynet", gzip=gzip)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StubConnection:
+    # stands in for a serial port: the caller calls the listener itself
+
+    def __init__(self, name="bench"):
+        self.name = name
+        self.listener = None
+
+    def add_batch_listener(self, listener):
+        self.listener = listener
+
+    def remove_listener(self, listener):
+        self.listener = None
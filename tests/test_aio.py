@@ -0,0 +1,127 @@
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import os
+import tty
+
+import pytest
+
+from conftest import wait_for
+from skynet_aio import SkyNetAsyncSerial, SkyNetSerialLoop
+from skynet_frame import SkynetFrameDecoder, encode_frame
+
+FRAMES = [(0x100 + i, i % 5 == 0, tuple((i + j) % 256 for j in range(i % 9))) for i in range(200)]
+
+
+@pytest.fixture
+def pty():
+    master, slave = os.openpty()
+    # no line discipline: bytes go through as they are
+    tty.setraw(slave)
+    loop = SkyNetSerialLoop()
+    yield master, slave, loop
+    loop.stop()
+    for fd in (master, slave):
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+
+def test_read_batches(pty):
+    master, slave, loop = pty
+    s = loop.add(SkyNetAsyncSerial(slave, name="pty"))
+    received = []
+    s.add_batch_listener(lambda batch: received.extend((f.address, f.rtr, tuple(bytes(f.data))) for f in batch))
+
+    data = b''.join(encode_frame(a, r, d) for a, r, d in FRAMES)
+    for i in range(0, len(data), 100):
+        os.write(master, data[i:i + 100])
+
+    assert wait_for(lambda: len(received) == len(FRAMES))
+    assert received == FRAMES
+    assert (s.rejected_frames, s.resync_events, s.byte_errors) == (0, 0, 0)
+
+
+def test_send(pty):
+    master, slave, loop = pty
+    s = loop.add(SkyNetAsyncSerial(slave, name="pty"))
+
+    for a, r, d in FRAMES:
+        assert s.send(a, r, d)
+
+    decoder = SkynetFrameDecoder()
+    sent = []
+    while len(sent) < len(FRAMES):
+        sent += [(f.address, f.rtr, tuple(bytes(f.data))) for f in decoder.feed(os.read(master, 4096))]
+
+    assert sent == FRAMES
+
+
+def test_master_closed(pty):
+    master, slave, loop = pty
+    s = loop.add(SkyNetAsyncSerial(slave, name="pty"))
+    assert not s.error
+
+    os.close(master)
+
+    assert wait_for(lambda: s.error)
+    assert not s.running
+    assert not s.send(0x100, False, [1])
+
+
+def test_reopen_after_unplug(tmp_path):
+    # a symlink, like /dev/serial/by-id, pointed at a fresh pty on replug
+    link = str(tmp_path / "tty")
+
+    def plug():
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(os.ttyname(slave), link)
+        return master, slave
+
+    os.symlink(str(tmp_path / "missing"), link)
+    loop = SkyNetSerialLoop()
+    s = loop.add(SkyNetAsyncSerial(link, name="pty"))
+    received = []
+    s.add_batch_listener(lambda batch: received.extend(f.address for f in batch))
+
+    # not plugged in yet
+    assert s.error and s.running
+    ports = [plug()]
+    assert wait_for(lambda: not s.error)
+
+    for i in range(3):
+        master, slave = ports[-1]
+        os.write(master, encode_frame(0x100 + i, False, [i]))
+        assert wait_for(lambda: len(received) == i + 1)
+
+        os.close(master)
+        os.close(slave)
+        assert wait_for(lambda: s.error)
+        ports.append(plug())
+        assert wait_for(lambda: not s.error)
+
+    master, slave = ports[-1]
+    os.write(master, encode_frame(0x200, False, []))
+    assert wait_for(lambda: len(received) == 4)
+
+    assert received == [0x100, 0x101, 0x102, 0x200]
+    assert s.reconnects == 4
+    assert len(s.gaps) == 4 and all(lost <= restored for lost, restored in s.gaps)
+
+    loop.stop()
+    assert not s.running
+    os.close(master)
+    os.close(slave)
@@ -0,0 +1,59 @@
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+from skynet_dedup import SkyNetDedup
+
+
+def test_twin_used_up_before_expiry():
+    d = SkyNetDedup()
+    x = [1, 2, 3]
+    y = [4, 5, 6]
+
+    assert d.first('A', 0.0, 0x100, False, x)
+    assert d.first('A', 0.1, 0x100, False, x)
+    # B missed the first one; its copy is the twin of A's second
+    assert not d.first('B', 0.101, 0x100, False, x)
+    assert d.first('A', 0.2, 0x100, False, y)
+    assert not d.first('B', 0.201, 0x100, False, y)
+
+    # expires A's copy at 0.0 and the used up one at 0.1
+    assert d.first('A', 1.3, 0x100, False, y)
+    assert d.first('A', 1.4, 0x100, False, x)
+
+    assert d.duplicates == 2
+    assert d._seen.keys() == {(0x100, False, bytes(x)), (0x100, False, bytes(y))}
+
+
+def test_repeats_from_both_sources():
+    d = SkyNetDedup()
+    x = [1, 2, 3]
+
+    # a 100 Hz repeat of one payload, A's batch handled before B's
+    kept = [d.first('A', i * 0.01, 0x100, False, x) for i in range(20)]
+    kept += [d.first('B', i * 0.01 + 0.001, 0x100, False, x) for i in range(20)]
+
+    assert kept.count(True) == 20
+    assert d.duplicates == 20
+
+
+def test_expiry_empties_memory():
+    d = SkyNetDedup(max_entries=8)
+
+    for i in range(100):
+        d.first('A', i * 0.01, 0x100, False, [i % 3])
+        d.first('B', i * 0.01, 0x100, False, [i % 3])
+
+    d.first('A', 100.0, 0x101, False, [0])
+
+    assert len(d._seen) == 1
+    assert len(d._order) == 1
+    assert d.duplicates == 100
@@ -0,0 +1,45 @@
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import json
+
+from conftest import wait_for
+from skynet_dispatch import SkyNetDispatch
+from skynet_frame import SkynetFrameDecoder, encode_frame
+
+
+def test_frame_listener_gets_lists():
+    dispatch = SkyNetDispatch()
+    events = []
+
+    # like the old SSE and file loggers
+    def listener(timestamp, address, rtr, data_length, data_bytes):
+        events.append(json.dumps({"address": address, "rtr": rtr, "length": data_length, "data": data_bytes}))
+
+    batches = []
+    dispatch.add_listener(listener)
+    dispatch.add_batch_listener(batches.append)
+
+    decoder = SkynetFrameDecoder()
+    dispatch.publish(decoder.feed(encode_frame(0x100, False, [1, 2, 3]) + encode_frame(0x101, True, [])))
+
+    assert wait_for(lambda: len(events) == 2 and batches)
+    assert [json.loads(e) for e in events] == [
+        {"address": 0x100, "rtr": False, "length": 3, "data": [1, 2, 3]},
+        {"address": 0x101, "rtr": True, "length": 0, "data": []}
+    ]
+    assert [s["errors"] for s in dispatch.stats()] == [0, 0]
+    # batch listeners keep the payload in one buffer
+    assert bytes(batches[0].data(0)) == b'\x01\x02\x03'
+
+    dispatch.remove_listener(listener)
+    dispatch.remove_listener(batches.append)
@@ -0,0 +1,99 @@
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import random
+
+from skynet_frame import SkynetFrameDecoder, encode_frame
+
+# payloads full of start (0x7E) and escape (0x7D) bytes, so most frames are
+# escaped somewhere
+FRAMES = [
+    (0x100, False, (1, 2, 3)),
+    (0x7E, False, (0x7E, 0x7D, 0x7E)),
+    (0x3EF, True, ()),
+    (0x7D * 8 + 6, False, (0x7D,) * 15),
+    (0x555, False, tuple(range(0x70, 0x7F))),
+    (1, True, (0x7E,)),
+]
+
+
+def stream(frames):
+    return b''.join(encode_frame(a, r, d) for a, r, d in frames)
+
+
+def decode(chunks, decoder=None):
+    decoder = decoder or SkynetFrameDecoder()
+    frames = []
+    for chunk in chunks:
+        frames += [(f.address, f.rtr, tuple(bytes(f.data))) for f in decoder.feed(chunk)]
+    return frames, decoder
+
+
+def test_whole_stream():
+    frames, decoder = decode([stream(FRAMES)])
+    assert frames == FRAMES
+    assert (decoder.crc_errors, decoder.resyncs, decoder.byte_errors) == (0, 0, 0)
+
+
+def test_every_split_point():
+    # escape bytes, start bytes and CRCs all end up on a chunk boundary
+    data = stream(FRAMES)
+    for i in range(1, len(data)):
+        frames, decoder = decode([data[:i], data[i:]])
+        assert frames == FRAMES, i
+        assert (decoder.crc_errors, decoder.resyncs, decoder.byte_errors) == (0, 0, 0)
+
+
+def test_one_byte_at_a_time():
+    data = stream(FRAMES)
+    frames, decoder = decode([data[i:i + 1] for i in range(len(data))])
+    assert frames == FRAMES
+
+
+def test_random_chunks():
+    r = random.Random(0)
+    data = stream(FRAMES * 50)
+    for trial in range(20):
+        chunks = []
+        i = 0
+        while i < len(data):
+            n = r.randint(1, 40)
+            chunks.append(data[i:i + n])
+            i += n
+        frames, decoder = decode(chunks)
+        assert frames == FRAMES * 50
+
+
+def test_bad_crc_drops_only_that_frame():
+    good = encode_frame(0x100, False, (1, 2, 3))
+    bad = bytearray(good)
+    bad[-1] ^= 1
+    data = good + bytes(bad) + good
+
+    for i in range(1, len(data)):
+        frames, decoder = decode([data[:i], data[i:]])
+        assert frames == [(0x100, False, (1, 2, 3))] * 2, i
+        assert decoder.crc_errors == 1
+
+
+def test_resync_after_truncated_frame():
+    cut = encode_frame(0x200, False, (0x7D, 9, 9, 9))[:4]
+    data = b'\x55\x7d\x20' + stream(FRAMES[:2]) + cut + stream(FRAMES[2:])
+
+    for i in range(1, len(data)):
+        frames, decoder = decode([data[:i], data[i:]])
+        assert frames == FRAMES, i
+        assert decoder.resyncs == 1
+        assert decoder.crc_errors == 0
+        # the leading noise, and the two bytes of the cut frame that were
+        # in (the dangling escape never became a byte)
+        assert decoder.byte_errors == 3 + 2
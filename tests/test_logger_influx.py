@@ -0,0 +1,110 @@
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import time
+
+from conftest import wait_for
+from logger_influx import SkyNetDBLogger
+
+
+def start_logger(stub, connection, definitions, max_points=1 << 30, max_bytes=1 << 30, max_age=60.0, **kwargs):
+    class DB:
+        client = stub.client()
+
+    logger = SkyNetDBLogger("test", connection, DB, definitions_file=definitions, **kwargs)
+    logger.MAX_POINTS = max_points
+    logger.MAX_BYTES = max_bytes
+    logger.MAX_AGE = max_age
+    logger.start()
+    return logger
+
+
+def test_flush_on_points(stub, connection, definitions, batches):
+    logger = start_logger(stub, connection, definitions, max_points=100)
+
+    for batch in batches(10, 100):
+        connection.listener(batch)
+
+    # long before MAX_AGE
+    assert wait_for(lambda: stub.lines == 1000)
+    assert stub.writes == 10
+    assert logger.stats()["batch_size"]["max"] == 100
+    logger.stop()
+
+
+def test_flush_on_bytes(stub, connection, definitions, batches):
+    data = batches(10, 100)
+    logger = start_logger(stub, connection, definitions, max_bytes=1)
+
+    for batch in data:
+        connection.listener(batch)
+
+    # every batch on its own is over MAX_BYTES
+    assert wait_for(lambda: stub.lines == 1000)
+    assert stub.writes == 10
+    logger.stop()
+
+
+def test_flush_on_age(stub, connection, definitions, batches):
+    logger = start_logger(stub, connection, definitions, max_age=0.3)
+
+    start = time.monotonic()
+    for batch in batches(3, 10):
+        connection.listener(batch)
+
+    assert wait_for(lambda: stub.lines == 30)
+    assert time.monotonic() - start >= 0.3
+    assert stub.writes == 1
+    assert logger.stats()["flush_latency"]["max"] >= 0.3
+    logger.stop()
+
+
+def test_stop_sends_pending(stub, connection, definitions, batches):
+    logger = start_logger(stub, connection, definitions)
+
+    for batch in batches(5, 100):
+        connection.listener(batch)
+    logger.stop()
+
+    assert stub.lines == 500
+    assert logger.stats()["points"] == 500
+
+
+class DecodedConnection:
+    # like SkyNetIngest: hands the logger records that are already decoded
+
+    def __init__(self):
+        self.name = "ingest"
+        self.listener = None
+
+    def add_decoded_listener(self, listener):
+        self.listener = listener
+
+    def remove_listener(self, listener):
+        self.listener = None
+
+
+def test_decoded_skips_short_frames(stub, definitions):
+    connection = DecodedConnection()
+    logger = start_logger(stub, connection, definitions)
+    count = len(logger.get_decoder().packets_by_address[0x100]["data"])
+    padding = (0.0,) * 15
+
+    connection.listener([
+        (1.0, 0x100, 1, 0, 0, b'') + padding,
+        (2.0, 0x100, 0, 8, count, bytes(8)) + padding,
+        (3.0, 0x100, 0, 8, count, bytes(8)) + (1.0,) * count + padding[count:]
+    ])
+    logger.stop()
+
+    assert stub.lines == 2
+    assert logger.stats()["errors"] == 0
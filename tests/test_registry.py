@@ -0,0 +1,36 @@
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import hashlib
+import json
+
+from conftest import wait_for
+from skynet_registry import SkynetRegistry
+
+
+def test_module_generated_late(tmp_path, definitions):
+    with open(definitions) as f:
+        text = f.read()
+    module = tmp_path / "skynet_packets.py"
+
+    registry = SkynetRegistry(definitions, interval=0.05, module_path=str(module))
+    registry.start()
+    assert registry.get().generated is None
+
+    # lands well after packets.json, past the registry's grace period
+    module.write_text("DEFINITIONS_SHA1 = %r\nPACKETS = %r\nDECODERS = %r\n" % (
+        hashlib.sha1(text.encode('utf-8')).hexdigest(), json.loads(text),
+        {d["address"]: None for d in json.loads(text)}))
+
+    assert wait_for(lambda: registry.get().generated is not None)
+    assert registry.version == 2
+    assert registry.error is None
@@ -0,0 +1,146 @@
+# Copyright (c) 2016, Jonathan Nutzmann
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import os
+
+import pytest
+
+from conftest import wait_for
+from stubs import StubInflux
+from logger_influx import SkyNetDBLogger
+from skynet_spool import SkyNetSpool
+from skynet_writer import SkyNetWriterPool
+
+
+def drain(spool):
+    records = []
+    while True:
+        record = spool.peek()
+        if record is None:
+            return records
+        records.append(record)
+        spool.commit()
+
+
+def test_replay_in_order_across_segments(tmp_path):
+    spool = SkyNetSpool(str(tmp_path), segment_bytes=64)
+    bodies = [(i, b"m x=%ii %i\n" % (i, i)) for i in range(50)]
+    for count, body in bodies:
+        spool.append(count, body)
+
+    assert len(spool) > 1
+    assert drain(spool) == bodies
+    assert os.listdir(str(tmp_path)) == []
+    assert spool.stats()["bytes"] == 0
+
+
+def test_picked_up_after_restart_and_torn_record(tmp_path):
+    spool = SkyNetSpool(str(tmp_path), segment_bytes=64)
+    bodies = [(1, b"m x=%ii %i\n" % (i, i)) for i in range(20)]
+    for count, body in bodies:
+        spool.append(count, body)
+    last = spool.segments[-1]
+
+    # a crash in the middle of the next record
+    with open(os.path.join(str(tmp_path), "%012i.spool" % last), 'ab') as f:
+        f.write(b'\x40\x00\x00')
+
+    spool = SkyNetSpool(str(tmp_path), segment_bytes=64)
+    assert drain(spool) == bodies
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_bounded_by_dropping_oldest(tmp_path):
+    spool = SkyNetSpool(str(tmp_path), segment_bytes=1024, max_bytes=4096)
+    body = b"m x=1i 1\n" * 20
+    for i in range(100):
+        spool.append(20, body)
+
+    assert spool.stats()["bytes"] <= 4096 + 1024
+    assert sum(os.path.getsize(os.path.join(str(tmp_path), f)) for f in os.listdir(str(tmp_path))) == \
+        spool.stats()["bytes"]
+
+    kept = sum(count for count, body in drain(spool))
+    assert kept + spool.stats()["dropped"] == 2000
+    assert kept > 0
+
+
+@pytest.mark.parametrize("workers", [0, 3])
+def test_no_points_lost_across_outage(stub, connection, definitions, batches, tmp_path, workers):
+    directory = str(tmp_path / "spool")
+
+    class DB:
+        client = stub.client()
+
+    pool = SkyNetWriterPool(stub.client, workers) if workers else None
+    spool = SkyNetSpool(directory, segment_bytes=4096)
+    logger = SkyNetDBLogger("test", connection, DB, spool=spool, pool=pool, definitions_file=definitions)
+    logger.MAX_AGE = 0.05
+    logger.RETRY_MIN = logger.RETRY_MAX = 0.2
+    logger.start()
+
+    data = batches(30, 100)
+
+    for batch in data[:10]:
+        connection.listener(batch)
+    assert wait_for(lambda: stub.lines == 1000)
+
+    # influx goes away, and comes back while frames keep arriving
+    stub.stop()
+    for batch in data[10:20]:
+        connection.listener(batch)
+    assert wait_for(lambda: spool.stats()["spooled"] > 0)
+    assert stub.lines == 1000
+
+    stub.up()
+    for batch in data[20:]:
+        connection.listener(batch)
+
+    assert wait_for(lambda: stub.lines == 3000 and spool.stats()["segments"] == 0, timeout=10.0)
+    logger.stop()
+    if pool is not None:
+        pool.stop()
+
+    stats = spool.stats()
+    assert stub.lines == 3000
+    assert stats["dropped"] == 0
+    assert stats["replayed"] == stats["spooled"]
+    assert logger.stats()["points"] == 3000
+    assert os.listdir(directory) == []
+
+
+def test_stop_waits_for_writes_in_flight(connection, definitions, batches, tmp_path):
+    stub = StubInflux(delay=0.2)
+
+    class DB:
+        client = stub.client()
+
+    pool = SkyNetWriterPool(stub.client, 2)
+    logger = SkyNetDBLogger("test", connection, DB, spool=SkyNetSpool(str(tmp_path)), pool=pool,
+                            definitions_file=definitions)
+    logger.MAX_POINTS = 100
+    logger.start()
+
+    waits = []
+    wait = logger._wake.wait
+    logger._wake.wait = lambda timeout=None: waits.append(timeout) or wait(timeout)
+
+    for batch in batches(10, 100):
+        connection.listener(batch)
+    logger.stop()
+    pool.stop()
+    stub.close()
+
+    assert stub.lines == 1000
+    # it sleeps until the pool hands writes back, rather than spinning
+    assert len(waits) < 100
+    assert min(waits) >= 0